@@ -1,11 +1,12 @@
 {
     "name": "Report",
-    "version": "16.0",
+    "version": "16.0.16.1",
     "category": "",
     "summary": "Summary",
     "description": """ Description """,
     "depends": [
         "base",
+        "bus",
     ],
     "author": "",
     "license": "",
@@ -13,16 +14,22 @@
     "data": [
         "data/report_data.xml",
         "security/ir.model.access.csv",
+        "data/report_job_data.xml",
+        "data/report_output_cache_data.xml",
+        "data/report_run_log_data.xml",
+        "data/report_download_data.xml",
         "views/report_report_view.xml",
+        "views/report_job_view.xml",
+        "views/report_run_log_view.xml",
     ],
     "assets": {
         'web.assets_backend': [
-
+            "report/static/src/js/report_notification_service.js",
         ],
     },
     "application": True,
     "external_dependencies": {
-        "python": ["docxtpl", "xltpl", "Pillow", "num2words", "Jinja2", "xlsx2html", "python-barcode", "python-docx"],
+        "python": ["docxtpl", "xltpl", "Pillow", "num2words", "Jinja2", "xlsx2html", "pdfkit", "python-barcode", "python-docx"],
     },
 }
 
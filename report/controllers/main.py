@@ -0,0 +1,22 @@
+from odoo import http
+from odoo.http import request, Stream
+
+
+class ReportController(http.Controller):
+
+    @http.route("/report_download/<int:download_id>/<string:token>", type="http", auth="user")
+    def report_download(self, download_id, token, download=False, **kwargs):
+        """Streams file of report download of current user from disk."""
+        download_id = request.env["report.download"].sudo().browse(download_id).exists()
+        if not download_id or download_id.user_id.id != request.env.uid or not download_id._check_token(token):
+            raise request.not_found()
+        stream = Stream(
+            type="path",
+            path=download_id._get_path(),
+            mimetype=download_id.mimetype,
+            download_name=download_id.name,
+            size=download_id.file_size,
+            last_modified=download_id.create_date,
+            conditional=True,
+        )
+        return stream.get_response(as_attachment=bool(download))
@@ -0,0 +1,16 @@
+from odoo import api, SUPERUSER_ID
+
+
+def migrate(cr, version):
+    """Moves templates from column of report_report to filestore attachments."""
+    cr.execute("""
+        SELECT 1 FROM information_schema.columns
+        WHERE table_name = 'report_report' AND column_name = 'template_legacy'
+    """)
+    if not cr.fetchone():
+        return
+    env = api.Environment(cr, SUPERUSER_ID, {})
+    cr.execute("SELECT id, template_legacy FROM report_report WHERE template_legacy IS NOT NULL")
+    for report_id, template in cr.fetchall():
+        env["report.report"].browse(report_id).write({"template": bytes(template)})
+    cr.execute("ALTER TABLE report_report DROP COLUMN template_legacy")
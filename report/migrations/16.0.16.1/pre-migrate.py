@@ -0,0 +1,8 @@
+def migrate(cr, version):
+    """Keeps templates stored in column of report_report, the field is stored in attachments now."""
+    cr.execute("""
+        SELECT 1 FROM information_schema.columns
+        WHERE table_name = 'report_report' AND column_name = 'template'
+    """)
+    if cr.fetchone():
+        cr.execute("ALTER TABLE report_report RENAME COLUMN template TO template_legacy")
@@ -1,2 +1,6 @@
 from . import report_report
+from . import report_job
+from . import report_output_cache
+from . import report_run_log
+from . import report_download
 from . import ir_actions_server
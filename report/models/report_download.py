@@ -0,0 +1,85 @@
+import os
+import time
+from datetime import timedelta
+
+from odoo import models, fields, api
+from odoo.tools import config, consteq
+from odoo.tools.misc import hmac
+
+from ..tools.files import file_mimetype, file_size, write_to_path
+
+TOKEN_SCOPE = "report.download"
+
+
+class ReportDownload(models.Model):
+    _name = "report.download"
+    _description = "Report download"
+    _order = "id desc"
+
+    report_id = fields.Many2one(comodel_name="report.report", string="Report", required=True, ondelete="cascade")
+    user_id = fields.Many2one(comodel_name="res.users", string="User", required=True, ondelete="cascade")
+    name = fields.Char(string="File name", required=True)
+    mimetype = fields.Char(string="Mimetype")
+    file_size = fields.Integer(string="Size")
+    expiration = fields.Datetime(string="Expiration", required=True, index=True)
+
+    @api.model
+    def _get_lifetime(self) -> int:
+        """Returns seconds a download is valid, set in minutes by system parameter report.download_minutes."""
+        return int(self.env["ir.config_parameter"].sudo().get_param("report.download_minutes", 15)) * 60
+
+    @api.model
+    def _get_dir(self) -> str:
+        return os.path.join(config["data_dir"], "report_downloads", self.env.cr.dbname)
+
+    def _get_path(self) -> str:
+        return os.path.join(self._get_dir(), str(self.id))
+
+    @api.model
+    def _create_download(self, report_id, report_file):
+        """
+        Stores report file for download by current user. The file is copied by chunks to
+        a directory outside of filestore and is removed when the download expires.
+        """
+        download_id = self.sudo().create({
+            "report_id": report_id.id,
+            "user_id": self.env.uid,
+            "name": report_file.name,
+            "mimetype": file_mimetype(report_file.name),
+            "file_size": file_size(report_file),
+            "expiration": fields.Datetime.now() + timedelta(seconds=self._get_lifetime()),
+        })
+        # A file left under the id, e.g. by a restored database, is replaced.
+        write_to_path(report_file, download_id._get_path())
+        return download_id
+
+    def _get_token(self) -> str:
+        """Returns signature of download, its user and expiration."""
+        return hmac(self.env(su=True), TOKEN_SCOPE, (
+            self.id, self.user_id.id, self.name, fields.Datetime.to_string(self.expiration),
+        ))
+
+    def _get_url(self) -> str:
+        return f"/report_download/{self.id}/{self._get_token()}"
+
+    def _check_token(self, token) -> bool:
+        """Returns whether token is signature of download which hasn't expired yet."""
+        return bool(token) and self.expiration > fields.Datetime.now() and consteq(token, self._get_token())
+
+    @api.model
+    def _cron_cleanup(self):
+        """Removes expired downloads and files which don't belong to any download."""
+        self.search([("expiration", "<", fields.Datetime.now())]).unlink()
+        directory = self._get_dir()
+        if not os.path.isdir(directory):
+            return
+        download_ids = {str(download_id) for download_id in self.search([]).ids}
+        # Files of transactions which are still running are younger than the lifetime of downloads.
+        deadline = time.time() - self._get_lifetime()
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            if name not in download_ids and os.path.getmtime(path) < deadline:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
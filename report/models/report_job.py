@@ -0,0 +1,161 @@
+import json
+import logging
+import time
+
+from odoo import models, fields, api, _
+
+from ..tools import timing
+
+JOB_STATES = [
+    ("queued", "Queued"),
+    ("running", "Running"),
+    ("done", "Done"),
+    ("failed", "Failed"),
+]
+
+MAX_ATTEMPTS = 3
+# Seconds one cron run spends on jobs before it is triggered again.
+CRON_TIME_BUDGET = 60
+
+_logger = logging.getLogger(__name__)
+
+
+class ReportJob(models.Model):
+    _name = "report.job"
+    _description = "Report job"
+    _order = "id desc"
+
+    report_id = fields.Many2one(comodel_name="report.report", string="Report", required=True, ondelete="cascade")
+    user_id = fields.Many2one(comodel_name="res.users", string="User", required=True,
+                              default=lambda self: self.env.user)
+    res_model = fields.Char(string="Model", required=True)
+    res_ids = fields.Text(string="Record ids", required=True)
+    records_count = fields.Integer(string="Records")
+    processed_count = fields.Integer(string="Processed records")
+    progress = fields.Integer(string="Progress", compute="_compute_progress")
+    state = fields.Selection(selection=JOB_STATES, string="State", default="queued", required=True)
+    attempts = fields.Integer(string="Attempts")
+    error = fields.Text(string="Error")
+    chunk_attachment_ids = fields.Many2many(comodel_name="ir.attachment", relation="report_job_chunk_rel",
+                                            string="Chunks")
+    attachment_id = fields.Many2one(comodel_name="ir.attachment", string="Report file")
+
+    @api.depends("records_count", "processed_count")
+    def _compute_progress(self):
+        for job_id in self:
+            job_id.progress = job_id.records_count and 100 * job_id.processed_count // job_id.records_count
+
+    def _get_res_ids(self) -> list:
+        return json.loads(self.res_ids)
+
+    @api.model
+    def _enqueue(self, report_id, records):
+        """Creates job generating report of records in background."""
+        job_id = self.create({
+            "report_id": report_id.id,
+            "res_model": records._name,
+            "res_ids": json.dumps(records.ids),
+            "records_count": len(records),
+        })
+        self.env.ref("report.ir_cron_report_job")._trigger()
+        return job_id
+
+    @api.model
+    def _cron_process_jobs(self):
+        """Processes queued jobs chunk by chunk and triggers itself again while there is work left."""
+        deadline = time.monotonic() + CRON_TIME_BUDGET
+        failed_ids = []
+        while time.monotonic() < deadline:
+            job_id = self.search([("state", "in", ("queued", "running")), ("id", "not in", failed_ids)],
+                                 order="id", limit=1)
+            if not job_id:
+                break
+            if not job_id._process_next_chunk():
+                failed_ids.append(job_id.id)
+            self.env.cr.commit()
+        else:
+            self.env.ref("report.ir_cron_report_job")._trigger()
+
+    def _process_next_chunk(self) -> bool:
+        """
+        Renders next chunk of records, finishes the job after the last one.
+        Failed chunks are retried by next cron runs. Returns whether chunk succeeded.
+        """
+        self.ensure_one()
+        self.state = "running"
+        try:
+            with self.env.cr.savepoint():
+                if self.processed_count < self.records_count:
+                    self._render_chunk()
+                else:
+                    self._finish()
+        except Exception as e:
+            _logger.exception("Report job %s failed.", self.id)
+            self.attempts += 1
+            self.error = str(e)
+            self.state = "queued"
+            if self.attempts >= MAX_ATTEMPTS:
+                self.state = "failed"
+                self._notify(_("Report %s failed: %s", self.report_id.name, e), "danger")
+            return False
+        return True
+
+    def _get_report(self):
+        """Returns report in environment of job user."""
+        return self.report_id.with_user(self.user_id).sudo()
+
+    def _render_chunk(self):
+        report_id = self._get_report()
+        chunk_size = max(report_id.async_chunk_size, 1)
+        res_ids = self._get_res_ids()[self.processed_count:self.processed_count + chunk_size]
+        action_id = self.env["ir.actions.server"].sudo().search([("report_id", "=", report_id.id)], limit=1)
+        action_id = action_id.with_user(self.user_id).with_context(
+            active_model=self.res_model, active_ids=res_ids, active_id=res_ids[0],
+        )
+        eval_context = action_id._get_eval_context(action_id)
+        with timing.measure() as timings:
+            with timing.stage("merge"):
+                chunk_file = report_id._create_chunk_file(eval_context, start=self.processed_count)
+            with timing.stage("attachment"):
+                attachment_id = report_id._create_attachment(chunk_file)
+        report_id._log_run(timings, len(res_ids), attachment_id.file_size, background=True)
+        self.chunk_attachment_ids = [(4, attachment_id.id)]
+        self.processed_count += len(res_ids)
+        self.attempts = 0
+
+    def _finish(self):
+        report_id = self._get_report()
+        chunk_files = [
+            report_id._open_attachment(attachment_id) for attachment_id in self.chunk_attachment_ids.sorted("id")
+        ]
+        if len(chunk_files) == 1:
+            report_file = chunk_files[0]
+        else:
+            report_file = report_id._merge_chunk_files(chunk_files)
+        self.attachment_id = report_id._create_attachment(report_file)
+        self.chunk_attachment_ids.sudo().unlink()
+        self.state = "done"
+        self._notify(_("Report %s is ready.", self.report_id.name), "success", self._get_download_url())
+
+    def _get_download_url(self) -> str:
+        return f"/web/content/{self.attachment_id.id}?download=true"
+
+    def _notify(self, message, notification_type, url=None):
+        """Sends notification to user of job, url is opened by a download button of the notification."""
+        self.env["bus.bus"]._sendone(self.user_id.partner_id, "report_notification", {
+            "title": _("Report"),
+            "message": message,
+            "sticky": True,
+            "type": notification_type,
+            "url": url,
+            "url_label": _("Download"),
+        })
+
+    def action_download(self) -> dict:
+        self.ensure_one()
+        return self.report_id.download(self.attachment_id)
+
+    def action_retry(self):
+        self.filtered(lambda job_id: job_id.state == "failed").write({"state": "queued", "attempts": 0, "error": False})
+        self.env.ref("report.ir_cron_report_job")._trigger()
+
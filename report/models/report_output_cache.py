@@ -0,0 +1,89 @@
+import hashlib
+import json
+from datetime import timedelta
+
+from odoo import models, fields, api
+
+
+class ReportOutputCache(models.Model):
+    _name = "report.output.cache"
+    _description = "Report output cache"
+    _order = "last_used desc"
+
+    key = fields.Char(string="Key", required=True, index=True)
+    report_id = fields.Many2one(comodel_name="report.report", string="Report", required=True, ondelete="cascade")
+    res_model = fields.Char(string="Model")
+    res_id = fields.Integer(string="Record")
+    attachment_id = fields.Many2one(comodel_name="ir.attachment", string="Report file", required=True,
+                                    ondelete="cascade")
+    file_size = fields.Integer(string="Size")
+    last_used = fields.Datetime(string="Last used", default=fields.Datetime.now, index=True)
+
+    @api.model
+    def _get_keys(self, report_id, records, numbers=None) -> list:
+        """
+        Returns cache key of each record. Key depends on the report and its template, the user,
+        company and language of the environment, the record and its last modification and values
+        of dependency fields of report. Numbers of records are a part of keys when they are given.
+        """
+        dependencies = [path.strip() for path in (report_id.cache_dependencies or "").split(",") if path.strip()]
+        keys = []
+        for index, record in enumerate(records):
+            values = [
+                report_id.id,
+                report_id.template_checksum,
+                str(report_id.write_date),
+                self.env.uid,
+                self.env.company.id,
+                self.env.lang,
+                record._name,
+                record.id,
+                str(record.write_date),
+            ]
+            values.extend(record.mapped(path) for path in dependencies)
+            if numbers is not None:
+                values.append(numbers[index])
+            keys.append(hashlib.sha1(json.dumps(values, default=str).encode()).hexdigest())
+        return keys
+
+    @api.model
+    def _lookup(self, keys) -> dict:
+        """Returns cache entries by key and marks them as used."""
+        entries = self.search([("key", "in", list(set(keys)))])
+        entries.write({"last_used": fields.Datetime.now()})
+        return {entry.key: entry for entry in entries}
+
+    @api.model
+    def _store(self, report_id, record, key, attachment_id):
+        return self.create({
+            "key": key,
+            "report_id": report_id.id,
+            "res_model": record._name,
+            "res_id": record.id,
+            "attachment_id": attachment_id.id,
+            "file_size": attachment_id.file_size,
+        })
+
+    @api.model
+    def _cron_evict(self):
+        """
+        Removes entries unused for report.output_cache_ttl_days days and least recently used entries
+        over report.output_cache_max_size megabytes.
+        """
+        params = self.env["ir.config_parameter"].sudo()
+        ttl_days = int(params.get_param("report.output_cache_ttl_days", 30))
+        max_size = int(params.get_param("report.output_cache_max_size", 1024)) * 1024 * 1024
+        expired = self.search([("last_used", "<", fields.Datetime.now() - timedelta(days=ttl_days))])
+        total_size = 0
+        over_size = self.browse()
+        for entry in self.search_read([("id", "not in", expired.ids)], ["file_size"], order="last_used desc, id desc"):
+            total_size += entry["file_size"]
+            if total_size > max_size:
+                over_size |= self.browse(entry["id"])
+        (expired | over_size).unlink()
+
+    def unlink(self):
+        attachment_ids = self.attachment_id
+        result = super().unlink()
+        attachment_ids.unlink()
+        return result
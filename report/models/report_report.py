@@ -1,27 +1,28 @@
 import os
-import subprocess
+import pprint
+import random
+import shutil
 import sys
 from io import BytesIO, StringIO
-from base64 import encodebytes, decodebytes
-from zipfile import ZipFile, ZIP_DEFLATED
+from zipfile import ZipFile
 
-import docx
-import pdfkit
 import jinja2
-import barcode
-from docxtpl import InlineImage, DocxTemplate
-from docx.shared import Mm
-from xlsx2html import xlsx2html
-from xltpl.writerx import BookWriter
-from num2words import num2words
-from barcode.writer import ImageWriter
-from PIL import Image
-
 from odoo import models, fields, api, _
-from odoo.tools.mimetypes import guess_mimetype
 from odoo.exceptions import UserError
+from odoo.tools import config
+from odoo.tools.misc import find_in_path
+from odoo.tools.pdf import merge_pdf
+from odoo.tools.safe_eval import safe_eval
 import logging
 
+from ..tools import formatting, images, render, template_cache, timing
+from ..tools.barcodes import barcode_png
+from ..tools.files import (
+    CHUNK_SIZE, SPOOL_MAX_SIZE, SpooledReport, copy_to_path, file_checksum, file_mimetype, file_size,
+    merge_pdf_reports, merge_reports, write_zip_archive, zip_reports,
+)
+from ..tools.converter import Converter, ConversionError, convert_reports, get_converter
+
 
 DEFAULT_PYTHON_CODE = """# Available variables:
 #  - env: Odoo Environment on which the action is triggered
@@ -42,7 +43,23 @@ REPORT_TYPES = [
     ("txt", "txt"),
 ]
 
-doc = False
+# Logo of shipment details is placed on the left of a background this many times wider.
+LOGO_WIDTH_FACTOR = 3.5
+
+PDF_OUTPUTS = [
+    ("merge", "Single PDF"),
+    ("zip", "ZIP archive of PDFs"),
+]
+
+XLSX_OUTPUTS = [
+    ("zip", "ZIP archive of workbooks"),
+    ("sheets", "Single workbook"),
+]
+
+PDF_ENGINES = [
+    ("libreoffice", "LibreOffice"),
+    ("wkhtmltopdf", "HTML (wkhtmltopdf)"),
+]
 
 _logger = logging.getLogger(__name__)
 
@@ -54,9 +71,46 @@ class ReportReport(models.Model):
     name = fields.Char(string="Name", required=True)
     model_id = fields.Many2one(comodel_name="ir.model", string="Model")
     report_type = fields.Selection(selection=REPORT_TYPES, string="Report type", required=True)
-    template = fields.Binary(string="Template", required=True, attachment=False)
+    template = fields.Binary(string="Template", required=True, attachment=True)
     template_name = fields.Char(string="Template name")
+    template_checksum = fields.Char(string="Template checksum", compute="_compute_template_file", store=True)
+    template_size = fields.Integer(string="Template size", compute="_compute_template_file", store=True)
     is_single = fields.Boolean(string="Single")
+    pdf_output = fields.Selection(selection=PDF_OUTPUTS, string="PDF output", default="merge", required=True,
+                                  help="How pdf reports of several records are returned.")
+    pdf_engine = fields.Selection(selection=PDF_ENGINES, string="PDF engine", default="libreoffice", required=True,
+                                  help="Engine converting xlsx reports to pdf. HTML engine prints simple tables "
+                                       "without LibreOffice, docx reports are always converted by LibreOffice.")
+    xlsx_output = fields.Selection(selection=XLSX_OUTPUTS, string="XLSX output", default="zip", required=True,
+                                   help="How xlsx reports of several records are returned. Single workbook has "
+                                        "a sheet of every record and is rendered in one pass without output cache, "
+                                        "it isn't used by single reports.")
+    sheet_name_expression = fields.Char(string="Sheet name", default="record.display_name",
+                                        help="Python expression of the name of the sheet of a record, variables of "
+                                             "the code and record_number can be used. Names are cut to 31 "
+                                             "characters and repeated names are numbered.")
+    render_workers = fields.Integer(string="Render workers", default=1,
+                                    help="Number of processes rendering records in parallel. "
+                                         "0 uses all CPUs, 1 renders records one after another. Processes are "
+                                         "forked only by single threaded prefork workers, threaded server "
+                                         "renders records one after another.")
+    async_threshold = fields.Integer(string="Background threshold", default=0,
+                                     help="Reports of more records than this are generated in background "
+                                          "and the user is notified when they are ready. 0 disables background "
+                                          "generation.")
+    async_chunk_size = fields.Integer(string="Background chunk size", default=100,
+                                      help="Number of records rendered at once by background job.")
+    use_output_cache = fields.Boolean(string="Cache output",
+                                      help="Reuse rendered file of a record while the record, the report "
+                                           "and dependency fields are unchanged.")
+    cache_dependencies = fields.Char(string="Cache dependencies",
+                                     help="Comma separated field paths whose values also invalidate cached "
+                                          "output, e.g. partner_id.write_date, move_ids.write_date")
+    keep_attachment = fields.Boolean(string="Keep attachment",
+                                     help="Store generated reports as attachments. Otherwise the file is streamed "
+                                          "from a temporary download valid for minutes set by system parameter "
+                                          "report.download_minutes. Reports generated in background are always "
+                                          "kept.")
     code = fields.Text(string="Python Code",
                        default=DEFAULT_PYTHON_CODE,
                        help="Write Python code that the action will execute. Some variables are "
@@ -85,6 +139,49 @@ class ReportReport(models.Model):
                     "report_id": record_id.id
                 })
 
+    @api.depends("template")
+    def _compute_template_file(self):
+        attachments = self._get_template_attachments()
+        for record_id in self:
+            attachment_id = attachments.get(record_id.id)
+            record_id.template_checksum = attachment_id.checksum if attachment_id else False
+            record_id.template_size = attachment_id.file_size if attachment_id else 0
+
+    def _get_template_attachments(self) -> dict:
+        """Returns attachments storing templates of reports by report id."""
+        attachment_ids = self.env["ir.attachment"].sudo().search([
+            ("res_model", "=", self._name),
+            ("res_field", "=", "template"),
+            ("res_id", "in", self.ids),
+        ])
+        return {attachment_id.res_id: attachment_id for attachment_id in attachment_ids}
+
+    def _read_template(self) -> bytes:
+        """Returns template bytes read from filestore without base64 decoding."""
+        attachment_id = self._get_template_attachments().get(self.id)
+        if not attachment_id:
+            return b""
+        if attachment_id.store_fname:
+            with open(attachment_id._full_path(attachment_id.store_fname), "rb") as f:
+                return f.read()
+        return attachment_id.raw
+
+    def write(self, vals):
+        if "template" in vals:
+            template_cache.invalidate(self.ids)
+        return super().write(vals)
+
+    def _get_template(self) -> template_cache.Template:
+        """
+        Returns decoded template from cache of current worker.
+        Size of cache in megabytes is set by system parameter report.template_cache_size.
+        """
+        template_cache.templates.max_size = int(
+            self.env["ir.config_parameter"].sudo().get_param("report.template_cache_size", 64)
+        ) * 1024 * 1024
+        with timing.stage("template"):
+            return template_cache.get_template(self.id, self.template_checksum, self._read_template)
+
     def render_address(self, partner_id):
         """Returns address of partner."""
         address_elements = [
@@ -96,224 +193,473 @@ class ReportReport(models.Model):
         ]
         return ", ".join([str(x) for x in address_elements if x])
 
-    def replace_barcode(self, value, type, width, height, name, write_text=False):
-        """Replaces barcode in template by name."""
-        global doc
-        value = str(value)
-        EAN = barcode.get_barcode_class(type)
-        my_ean = EAN(value, writer=ImageWriter(), add_checksum=False)
-        fp = BytesIO()
-        if write_text:
-            options = {
-                "module_width": width,
-                "module_height": height,
-                "write_text": True,
-                "quiet_zone": 0,
-                "dpi": 300,
-                "font_size": 10,
-                "text_distance": 0.5,
-            }
-        else:
-            options = {
-                "module_width": width,
-                "module_height": height,
-                "write_text": False,
-                "quiet_zone": 0,
-                "dpi": 300,
-                "text_distance": 0,
-                "font_size": 0,
-            }
-        my_ean.write(fp, options=options)
-        fp.seek(0)
-        doc.replace_pic(name, fp)
-        return ""
-
-    def replace_image(self, value, name):
-        """Replaces image in document."""
-        global doc
-        image = Image.open(BytesIO(decodebytes(value)))
-        image_size = max(image.size)
-        background_image = Image.new("RGB", (image_size, image_size), "white")
-        background_image.paste(image)
-        fp = BytesIO()
-        background_image.save(fp, "png")
-        fp.seek(0)
-        doc.replace_pic(name, fp)
-        return ""
-
-    def render_barcode(self, value, type, width, height, write_text=False):
-        """Generates barcode by data."""
-        global doc
-        value = str(value)
-        EAN = barcode.get_barcode_class(type)
-        my_ean = EAN(value, writer=ImageWriter(), add_checksum=False)
-        fp = BytesIO()
-        if write_text:
-            options = {
-                "module_width": width,
-                "module_height": height,
-                "write_text": True,
-                "quiet_zone": 0,
-                "dpi": 300,
-                "font_size": 10,
-                "text_distance": 0.5,
-            }
-        else:
-            options = {
-                "module_width": width,
-                "module_height": height,
-                "write_text": False,
-                "quiet_zone": 0,
-                "dpi": 300,
-                "text_distance": 0,
-                "font_size": 0,
-            }
-        my_ean.write(fp, options=options)
-        return InlineImage(doc, fp, height=Mm(height))
-
     def _update_shipment_details_context(self, eval_context):
         """Updates context for shipment details report."""
         record_id = eval_context["record"]
-        eval_context["partner_address"] = self.render_address(record_id.odm_company_id or self.env.company.partner_id)
-        recipient_data_elements = [
-            record_id.partner_id.parent_id.name,
-            record_id.partner_id.name,
-            record_id.partner_id.parent_id.phone,
-        ]
-        eval_context["recipient_data"] = ", ".join([str(x) for x in recipient_data_elements if x])
-        recipient_address_elements = [
-            record_id.partner_id.name,
-            record_id.partner_id.street,
-            record_id.partner_id.city,
-            record_id.partner_id.state_id.name,
-            record_id.partner_id.zip,
-            record_id.partner_id.country_id.name,
-            record_id.partner_id.phone,
-        ]
-        eval_context["recipient_address"] = ", ".join([str(x) for x in recipient_address_elements if x])
-        packages = {}
-        for line_id in record_id.move_line_ids_without_package:
-            package_id = line_id.result_package_id
-            if not packages.get(package_id.name):
-                packages[package_id.name] = []
-            value = str(line_id.lot_id.name or "")
-            EAN = barcode.get_barcode_class("code39")
-            my_ean = EAN(value, writer=ImageWriter(), add_checksum=False)
-            fp = BytesIO()
-            options = {
-                "write_text": False,
-                "quiet_zone": 0,
-                "dpi": 300,
-                "text_distance": 0,
-                "font_size": 0,
+        eval_context.update(self._get_shipment_details_values(record_id)[record_id.id])
+
+    @staticmethod
+    def _read_by_id(records, field_names) -> dict:
+        """Returns values of records by id read with one query, relational fields as ids."""
+        return {values["id"]: values for values in records.read(field_names, load=None)} if records else {}
+
+    @staticmethod
+    def _join_elements(elements) -> str:
+        return ", ".join([str(x) for x in elements if x])
+
+    def _get_logo_image(self, image, size=0):
+        """Returns logo placed on the left of a wide white background, processed logos are cached."""
+        if not image:
+            return False
+        from PIL import Image
+        return Image.open(BytesIO(images.wide_png(image, LOGO_WIDTH_FACTOR, size)))
+
+    def _get_shipment_details_values(self, picking_ids) -> dict:
+        """
+        Returns context values of shipment details report for each picking.
+        Data is read in batches, so the number of queries doesn't depend on number of pickings and lines.
+        """
+        from PIL import Image
+        env = self.env
+        line_model = env[picking_ids._fields["move_line_ids_without_package"].comodel_name]
+        partner_model = env[picking_ids._fields["partner_id"].comodel_name]
+        company_model = env[picking_ids._fields["odm_company_id"].comodel_name]
+        company_partner_id = env.company.partner_id.id
+        pickings = self._read_by_id(picking_ids, ["partner_id", "odm_company_id", "move_line_ids_without_package"])
+        if company_model._name != partner_model._name:
+            # senders are partners of companies when the field refers to companies
+            company_partners = self._read_by_id(
+                company_model.browse({picking["odm_company_id"] for picking in pickings.values()} - {False}),
+                ["partner_id"],
+            )
+            for picking in pickings.values():
+                picking["odm_company_id"] = company_partners.get(picking["odm_company_id"], {}).get("partner_id")
+        lines = self._read_by_id(
+            line_model.browse([line_id for picking in pickings.values()
+                               for line_id in picking["move_line_ids_without_package"]]),
+            ["result_package_id", "lot_id", "product_id"],
+        )
+        packages = self._read_by_id(
+            env[line_model._fields["result_package_id"].comodel_name].browse(
+                {line["result_package_id"] for line in lines.values() if line["result_package_id"]}
+            ),
+            ["name", "shipping_weight"],
+        )
+        lots = self._read_by_id(
+            env[line_model._fields["lot_id"].comodel_name].browse(
+                {line["lot_id"] for line in lines.values() if line["lot_id"]}
+            ),
+            ["name"],
+        )
+        products = self._read_by_id(
+            env[line_model._fields["product_id"].comodel_name].browse(
+                {line["product_id"] for line in lines.values() if line["product_id"]}
+            ),
+            ["odm_name"],
+        )
+        partner_fields = ["name", "street", "city", "state_id", "zip", "country_id", "phone", "parent_id"]
+        company_ids = {picking["odm_company_id"] or company_partner_id for picking in pickings.values()}
+        partners = self._read_by_id(
+            partner_model.browse(
+                {picking["partner_id"] for picking in pickings.values() if picking["partner_id"]} | company_ids
+            ),
+            partner_fields,
+        )
+        partners.update(self._read_by_id(
+            partner_model.browse(
+                {partner["parent_id"] for partner in partners.values() if partner["parent_id"]} - set(partners)
+            ),
+            partner_fields,
+        ))
+        states = self._read_by_id(
+            env[partner_model._fields["state_id"].comodel_name].browse(
+                {partner["state_id"] for partner in partners.values() if partner["state_id"]}
+            ),
+            ["name"],
+        )
+        countries = self._read_by_id(
+            env[partner_model._fields["country_id"].comodel_name].browse(
+                {partner["country_id"] for partner in partners.values() if partner["country_id"]}
+            ),
+            ["name"],
+        )
+        image_size = self._get_template().image_size()
+        image_field = images.variant_field(image_size)
+        logos = {
+            partner_id: self._get_logo_image(values[image_field], image_size)
+            for partner_id, values in self._read_by_id(
+                partner_model.browse(company_ids | {company_partner_id}), [image_field]
+            ).items()
+        }
+        empty = {}
+
+        def partner_values(partner_id):
+            partner = partners.get(partner_id, empty)
+            return {
+                **partner,
+                "state_name": states.get(partner.get("state_id"), empty).get("name"),
+                "country_name": countries.get(partner.get("country_id"), empty).get("name"),
             }
-            my_ean.write(fp, options=options)
-            packages[package_id.name].append({
-                "package_name": package_id.name,
-                "package_weight": package_id.shipping_weight,
-                "product_name": line_id.product_id.odm_name,
-                "lot_name": line_id.lot_id.name,
-                "barcode": Image.open(fp),
-            })
-        eval_context["packages"] = dict(sorted(packages.items()))
-        _logger.info("package"*100)
-        _logger.info(eval_context["packages"])
-        if record_id.odm_company_id.image_1920:
-            image = Image.open(BytesIO(decodebytes(record_id.odm_company_id.image_1920)))
-            image_w, image_h = image.size
-            background_image = Image.new("RGB", (int(image_w * 3.5), image_h), "white")
-            background_image.paste(image)
-            fp = BytesIO()
-            background_image.save(fp, "png")
-            eval_context["image"] = Image.open(fp)
-        elif self.env.company.partner_id.image_1920:
-            image = Image.open(BytesIO(decodebytes(self.env.company.partner_id.image_1920)))
-            image_w, image_h = image.size
-            background_image = Image.new("RGB", (int(image_w * 3.5), image_h), "white")
-            background_image.paste(image)
-            fp = BytesIO()
-            background_image.save(fp, "png")
-            eval_context["image"] = Image.open(fp)
-        else:
-            eval_context["image"] = False
+
+        result = {}
+        for picking_id, picking in pickings.items():
+            sender = partner_values(picking["odm_company_id"] or company_partner_id)
+            recipient = partner_values(picking["partner_id"])
+            recipient_parent = partner_values(recipient.get("parent_id"))
+            package_lines = {}
+            for line_id in picking["move_line_ids_without_package"]:
+                line = lines[line_id]
+                package = packages.get(line["result_package_id"], {"name": False, "shipping_weight": 0.0})
+                lot_name = lots.get(line["lot_id"], empty).get("name", False)
+                package_lines.setdefault(package["name"], []).append({
+                    "package_name": package["name"],
+                    "package_weight": package["shipping_weight"],
+                    "product_name": products.get(line["product_id"], empty).get("odm_name", False),
+                    "lot_name": lot_name,
+                    "barcode": Image.open(BytesIO(barcode_png("code39", lot_name or ""))),
+                })
+            result[picking_id] = {
+                "partner_address": self._join_elements([
+                    sender.get("street"),
+                    sender.get("city"),
+                    sender["state_name"],
+                    sender.get("zip"),
+                    sender["country_name"],
+                ]),
+                "recipient_data": self._join_elements([
+                    recipient_parent.get("name"),
+                    recipient.get("name"),
+                    recipient_parent.get("phone"),
+                ]),
+                "recipient_address": self._join_elements([
+                    recipient.get("name"),
+                    recipient.get("street"),
+                    recipient.get("city"),
+                    recipient["state_name"],
+                    recipient.get("zip"),
+                    recipient["country_name"],
+                    recipient.get("phone"),
+                ]),
+                "packages": dict(sorted(package_lines.items())),
+                "image": logos.get(picking["odm_company_id"]) or logos.get(company_partner_id) or False,
+            }
+        return result
 
     def run(self, eval_context):
         """Creates report."""
+        records = eval_context["records"]
+        if not self.is_single and self.async_threshold and len(records) > self.async_threshold:
+            return self._run_in_background(records)
         if self.is_single:
             eval_context["records"] = [eval_context["records"]]
-        jinja_env = jinja2.Environment()
-        jinja_env.filters["render_barcode"] = self.render_barcode
-        jinja_env.filters["replace_barcode"] = self.replace_barcode
-        jinja_env.filters["replace_image"] = self.replace_image
-        report_files = self._create_reports(eval_context, jinja_env)
-        report_file = self._merge_into_one_file(report_files)
-        attachment_id = self._create_attachment(report_file)
-        return self.download(attachment_id)
+        with timing.measure() as timings:
+            jinja_env = self._get_jinja_env()
+            report_files = self._create_reports(eval_context, jinja_env)
+            with timing.stage("merge"):
+                report_file = self._merge_into_one_file(report_files)
+            with timing.stage("attachment"):
+                if self.keep_attachment:
+                    attachment_id = self._create_attachment(report_file)
+                    url, bytes_out = f"/web/content/{attachment_id.id}", attachment_id.file_size
+                else:
+                    download_id = self.env["report.download"]._create_download(self, report_file)
+                    url, bytes_out = download_id._get_url(), download_id.file_size
+        self._log_run(timings, len(eval_context["records"]), bytes_out)
+        return self._get_download_action(url)
+
+    def _log_run(self, timings, records_count, bytes_out, background=False):
+        """Records durations of stages of report generation in run log."""
+        _logger.info("Report %s: %s records, %s bytes in %.3fs (%s)", self.name, records_count, bytes_out,
+                     timings.total, ", ".join(f"{stage} {duration:.3f}s"
+                                              for stage, duration in timings.durations.items() if duration))
+        self.env["report.run.log"].sudo().create({
+            "report_id": self.id,
+            "user_id": self.env.uid,
+            "background": background,
+            "records_count": records_count,
+            "bytes_out": bytes_out,
+            "duration": timings.total,
+            **{f"duration_{stage}": duration for stage, duration in timings.durations.items()},
+        })
+
+    @api.model
+    def _get_jinja_env(self):
+        """Returns jinja environment of current worker, compiled templates are cached in data directory."""
+        return render.get_jinja_env(os.path.join(config["data_dir"], "report_jinja_cache"))
+
+    def _run_in_background(self, records) -> dict:
+        """Queues job generating report and returns notification for user."""
+        self.env["report.job"].sudo()._enqueue(self, records)
+        return {
+            "type": "ir.actions.client",
+            "tag": "display_notification",
+            "params": {
+                "title": self.name,
+                "message": _("Report of %s records is generated in background, "
+                             "you will be notified when it's ready.", len(records)),
+                "type": "info",
+                "sticky": False,
+            },
+        }
+
+    def _create_chunk_file(self, eval_context, start=0):
+        """Returns one file with reports of a chunk of records of background job."""
+        reports = self._create_reports(eval_context, self._get_jinja_env(), start)
+        if self._use_single_workbook():
+            return next(reports)
+        if self.report_type == "pdf" and self.pdf_output == "merge":
+            return self._merge_pdf_reports(reports)
+        return self._create_zip_archive(reports, start + 1)
+
+    def _merge_chunk_files(self, chunk_files):
+        """Returns final report file from files of chunks of background job."""
+        if self._use_single_workbook():
+            return self._create_zip_archive(chunk_files)
+        if self.report_type == "pdf" and self.pdf_output == "merge":
+            return self._merge_pdf_reports(chunk_files)
+        return self._merge_zip_archives(chunk_files)
 
     def download(self, attachment_id) -> dict:
         """Download report."""
+        return self._get_download_action(f"/web/content/{attachment_id.id}")
+
+    def _get_download_action(self, url) -> dict:
+        """Returns action opening pdf report or downloading report of other types from url."""
         if self.report_type == "pdf":
             return {
                 "type": "ir.actions.report",
                 "report_type": "qweb-pdf",
                 # "close_on_report_download": True,
-                "url": f"/web/content/{attachment_id.id}",
+                "url": url,
                 "target": "new",
             }
         return {
             "type": "ir.actions.act_url",
             # "close_on_report_download": True,
-            "url": f"/web/content/{attachment_id.id}?download=true",
+            "url": f"{url}?download=true",
             "target": "new",
         }
 
     @staticmethod
     def formatting_float(number: float) -> str:
         """Returns number with comma."""
-        if number is False:
-            return "0,00"
-        return "{:.2f}".format(round(number, 2)).replace(".", ",")
+        return formatting.formatting_float(number)
 
     @staticmethod
     def price2words(price: float) -> str:
         """Returns price in rubles and kopecks as words."""
-        if price is False:
-            return ""
-        rubles = num2words(int(price), lang="ru")
-        kopecks = num2words(round((price - int(price)) * 100), lang="ru")
-        return f"{rubles} руб. {kopecks} коп."
+        return formatting.price2words(price)
 
     def _create_attachment(self, report_file):
-        """Creates and returns attachment."""
-        return self.env["ir.attachment"].create(
-            {
+        """
+        Creates and returns attachment. With file storage big reports are copied to filestore
+        by chunks instead of being read in memory. Reports which are already stored
+        in an attachment share its file.
+        """
+        attachment_model = self.env["ir.attachment"]
+        stored_attachment_id = getattr(report_file, "attachment_id", None)
+        if stored_attachment_id and stored_attachment_id.store_fname:
+            return self._create_attachment_from_file(
+                report_file.name,
+                stored_attachment_id.store_fname,
+                stored_attachment_id.file_size,
+                stored_attachment_id.checksum,
+                stored_attachment_id.mimetype,
+            )
+        if attachment_model._storage() != "file" or file_size(report_file) <= SPOOL_MAX_SIZE:
+            report_file.seek(0)
+            return attachment_model.create({
                 "name": report_file.name,
-                "datas": encodebytes(report_file.getvalue()),
-            }
+                "raw": report_file.read(),
+                "mimetype": file_mimetype(report_file.name),
+            })
+        checksum = file_checksum(report_file)
+        store_fname = f"{checksum[:2]}/{checksum}"
+        copy_to_path(report_file, attachment_model._full_path(store_fname))
+        attachment_model._mark_for_gc(store_fname)
+        return self._create_attachment_from_file(
+            report_file.name, store_fname, file_size(report_file), checksum, file_mimetype(report_file.name),
+        )
+
+    def _create_attachment_from_file(self, name, store_fname, size, checksum, mimetype):
+        """
+        Creates attachment of a file already in filestore. Attachment create() drops file fields,
+        so they are set by query like ir.attachment does after writing a file.
+        """
+        attachment_id = self.env["ir.attachment"].create({"name": name, "mimetype": mimetype})
+        self.env.cr.execute(
+            """
+            UPDATE ir_attachment
+            SET store_fname = %s, file_size = %s, checksum = %s, mimetype = %s, db_datas = NULL
+            WHERE id = %s
+            """,
+            (store_fname, size, checksum, mimetype, attachment_id.id),
         )
+        attachment_id.invalidate_recordset(["store_fname", "file_size", "checksum", "mimetype", "db_datas", "raw",
+                                            "datas"])
+        return attachment_id
+
+    @staticmethod
+    def _open_attachment(attachment_id):
+        """Returns content of attachment as file object named like attachment."""
+        if attachment_id.store_fname:
+            report_file = SpooledReport(attachment_id.name)
+            with open(attachment_id._full_path(attachment_id.store_fname), "rb") as f:
+                shutil.copyfileobj(f, report_file, CHUNK_SIZE)
+        else:
+            report_file = BytesIO(attachment_id.raw)
+            report_file.name = attachment_id.name
+        report_file.attachment_id = attachment_id
+        return report_file
 
-    def _merge_into_one_file(self, reports) -> BytesIO:
+    def _merge_into_one_file(self, reports):
         """Returns one final report file docx, xlsx, pdf, txt or zip archive."""
-        if len(reports) > 1:
-            return self._create_zip_archive(reports)
-        return reports[0]
-
-    def _create_reports(self, eval_context, jinja_env) -> list:
-        """Return list of reports."""
-        reports = []
-        for index, record in enumerate(eval_context["records"]):
-            eval_context.update({
-                "record": record,
-                "record_number": index,
-            })
-            if self.template_name == "ShipmentDetails.xlsx":
-                self._update_shipment_details_context(eval_context)
-            reports.append(self._create_report(eval_context, jinja_env))
+        merge = self.report_type == "pdf" and self.pdf_output == "merge"
+        return merge_reports(reports, self.name, merge_pdf if merge else None)
+
+    def _merge_pdf_reports(self, reports) -> BytesIO:
+        """Returns one pdf with pages of all reports."""
+        return merge_pdf_reports(reports, self.name, merge_pdf)
+
+    def _create_reports(self, eval_context, jinja_env, start=0):
+        """Returns iterator of reports, each report is rendered when it's taken."""
+        records = eval_context["records"]
+        if self._use_single_workbook():
+            return self._render_workbook(eval_context, start)
+        if self.use_output_cache and isinstance(records, models.BaseModel):
+            return self._create_reports_cached(eval_context, jinja_env, start)
+        return self._render_reports(eval_context, jinja_env, start)
+
+    def _use_single_workbook(self) -> bool:
+        return self.report_type == "xlsx" and self.xlsx_output == "sheets" and not self.is_single
+
+    def _render_workbook(self, eval_context, start=0):
+        """Returns iterator of one xlsx report with a sheet of every record, rendered in one pass."""
+        contexts = list(timing.iterate("contexts", self._prepare_contexts(eval_context, start)))
+        sheet_names = [self._get_sheet_name(context) for context in contexts]
+        with timing.stage("render"):
+            return iter([render.render_xlsx_book(self._get_template(), contexts, sheet_names, self.name)])
+
+    def _get_sheet_name(self, context) -> str:
+        """Returns name of sheet of record evaluated from sheet name expression."""
+        if not self.sheet_name_expression:
+            return str(context["record_number"] + 1)
+        try:
+            return safe_eval(self.sheet_name_expression, dict(context))
+        except Exception as e:
+            raise UserError(_("Wrong sheet name expression %s of report %s: %s",
+                              self.sheet_name_expression, self.name, e))
+
+    def _create_reports_cached(self, eval_context, jinja_env, start=0):
+        """Yields reports of records from output cache, renders and stores only missing ones."""
+        cache_model = self.env["report.output.cache"].sudo()
+        records = eval_context["records"]
+        numbers = range(start, start + len(records)) if self._uses_record_number() else None
+        keys = cache_model._get_keys(self, records, numbers)
+        entries = cache_model._lookup(keys)
+        missing = [(index, record.id) for index, (record, key) in enumerate(zip(records, keys), start)
+                   if key not in entries]
+        rendered_reports = iter(())
+        if missing:
+            rendered_reports = self._render_reports(
+                dict(eval_context, records=records.browse([record_id for _index, record_id in missing])),
+                jinja_env,
+                numbers=[index for index, _record_id in missing],
+            )
+        for record, key in zip(records, keys):
+            entry = entries.get(key)
+            if entry:
+                yield self._open_attachment(entry.attachment_id)
+                continue
+            report = next(rendered_reports)
+            with timing.stage("attachment"):
+                attachment_id = self.sudo()._create_attachment(report)
+            entries[key] = entry = cache_model._store(self, record, key, attachment_id)
+            attachment_id.write({"res_model": entry._name, "res_id": entry.id})
+            report.seek(0)
+            report.attachment_id = attachment_id
+            yield report
+
+    def _uses_record_number(self) -> bool:
+        """Returns whether template reads record_number, then output of a record depends on its position."""
+        try:
+            return "record_number" in self._get_template().paths()
+        except jinja2.TemplateSyntaxError:
+            return True
+
+    def _render_reports(self, eval_context, jinja_env, start=0, numbers=None):
+        """Returns iterator of reports rendered from templates, see _prepare_contexts for numbering."""
+        contexts = timing.iterate("contexts", self._prepare_contexts(eval_context, start, numbers))
+        workers = self._get_render_workers(len(eval_context["records"]))
+        reports = None
+        if workers > 1:
+            contexts = list(contexts)
+            reports = self._render_reports_parallel(contexts, workers)
+        if reports is None:
+            reports = timing.iterate("render", (self._render_report(context, jinja_env) for context in contexts))
+        if self.report_type == "pdf" and self._use_html_pdf_engine():
+            return timing.iterate("convert", self._convert_batch_to_pdf_html(reports))
+        if self.report_type == "pdf":
+            return timing.iterate("convert", self._convert_batch_to_pdf(reports))
         return reports
 
+    def _prepare_contexts(self, eval_context, start=0, numbers=None):
+        """
+        Yields render context of each record, records are numbered from start or by list of numbers
+        when they are a part of the records of report.
+        Share of contexts set by system parameter report.debug_sample_rate is logged.
+        """
+        records = eval_context["records"]
+        sample_rate = float(self.env["ir.config_parameter"].sudo().get_param("report.debug_sample_rate", 0))
+        shipment_details_values = None
+        if self.template_name == "ShipmentDetails.xlsx" and isinstance(records, models.BaseModel):
+            shipment_details_values = self._get_shipment_details_values(records)
+        for index, record in zip(numbers, records) if numbers is not None else enumerate(records, start):
+            context = dict(eval_context, record=record, record_number=index)
+            if shipment_details_values is not None:
+                context.update(shipment_details_values[record.id])
+            elif self.template_name == "ShipmentDetails.xlsx":
+                self._update_shipment_details_context(context)
+            if sample_rate and random.random() < sample_rate:
+                _logger.info("Report %s context of record %s:\n%s", self.name, index, pprint.pformat(
+                    {key: value for key, value in context.items() if key not in eval_context or key == "record"}
+                ))
+            yield context
+
+    def _get_render_workers(self, records_count) -> int:
+        """Returns number of processes for rendering records."""
+        if records_count < 2 or not render.parallel_available():
+            return 1
+        return min(self.render_workers or os.cpu_count() or 1, records_count)
+
+    def _get_render_type(self) -> str:
+        """Returns type of file rendered from template, pdf reports are converted from it afterwards."""
+        if self.report_type == "pdf":
+            return self._get_template().type
+        return self.report_type
+
+    def _render_report(self, eval_context, jinja_env) -> BytesIO:
+        """Returns rendered report, original docx or xlsx for pdf reports."""
+        if self.report_type == "pdf":
+            return self._get_original_report_and_type(eval_context, jinja_env)[0]
+        return self._create_report(eval_context, jinja_env)
+
+    def _render_reports_parallel(self, contexts, workers):
+        """
+        Returns reports rendered by a pool of processes. Records are read here and only plain
+        data is sent to processes. Returns None when context can't be copied.
+        """
+        template = self._get_template()
+        with timing.stage("contexts"):
+            payloads = render.build_payloads(template, contexts)
+        if payloads is None:
+            _logger.warning("Report %s can't be rendered in parallel, rendering sequentially.", self.name)
+            return None
+        with timing.stage("render"):
+            return render.render_parallel(template, self._get_render_type(), payloads, self.name, workers)
+
     def _create_report(self, eval_context, jinja_env) -> BytesIO:
         """Creating single report file."""
-        _logger.info(self.report_type)
         if self.report_type == "docx":
             report = self._create_docx_report(eval_context, jinja_env)
         elif self.report_type == "xlsx":
@@ -326,40 +672,15 @@ class ReportReport(models.Model):
 
     def _create_docx_report(self, eval_context, jinja_env) -> BytesIO:
         """Creating docx report."""
-        writer = DocxTemplate(BytesIO(decodebytes(self.template)))
-        global doc
-        doc = writer
-        writer.render(eval_context, jinja_env)
-        docx_report = BytesIO()
-        writer.save(docx_report)
-        docx_report.name = f"{self.name}.docx"
-        return docx_report
+        return render.render_docx(self._get_template(), eval_context, jinja_env, self.name)
 
     def _create_xlsx_report(self, eval_context, jinja_env) -> BytesIO:
         """Creating xlsx report."""
-        _logger.info("_create_xlsx_report"*100)
-        _logger.info(eval_context)
-        writer = BookWriter(BytesIO(decodebytes(self.template)))
-        eval_context["sheet_name"] = self.name
-        writer.render_book(payloads=[eval_context])
-        xlsx_report = BytesIO()
-        writer.save(xlsx_report)
-        xlsx_report.name = f"{self.name}.xlsx"
-        _logger.info("_create_xlsx_reportend"*100)
-        _logger.info(eval_context)
-        return xlsx_report
+        return render.render_xlsx(self._get_template(), eval_context, self.name)
 
     def _create_txt_report(self, eval_context, jinja_env) -> BytesIO:
         """Creating txt report."""
-        docx_report = self._create_docx_report(eval_context, jinja_env)
-        txt_report = BytesIO()
-        doc = docx.Document(docx_report)
-        text = ""
-        for paragraph in doc.paragraphs:
-            text += f"{paragraph.text}\n"
-        txt_report.write(text.encode())
-        txt_report.name = f"{self.name}.txt"
-        return txt_report
+        return render.render_txt(self._get_template(), eval_context, jinja_env, self.name)
 
     def _create_pdf_report(self, eval_context, jinja_env) -> BytesIO:
         """Creating pdf report."""
@@ -370,74 +691,75 @@ class ReportReport(models.Model):
 
     def _get_original_report_and_type(self, eval_context, jinja_env) -> [BytesIO, str]:
         """Return original report and type."""
-        if guess_mimetype(decodebytes(self.template)).split('/')[1] == "vnd.openxmlformats-officedocument.wordprocessingml.document":
+        if self._get_template().type == "docx":
             return self._create_docx_report(eval_context, jinja_env), "docx"
         return self._create_xlsx_report(eval_context, jinja_env), "xlsx"
 
     def docx2pdf(self, docx_report) -> BytesIO:
         """Converting docx to pdf format."""
-        attachment_id = self.env["ir.attachment"].create(
-            {
-                "name": docx_report.name,
-                "datas": encodebytes(docx_report.getvalue()),
-            }
-        )
-        file_path = os.path.abspath(attachment_id._full_path(attachment_id.store_fname))
-        if sys.platform == "win32":
-            outdir = "\\".join(file_path.split("\\")[:-1])
-        else:
-            outdir = "/".join(file_path.split("/")[:-1])
-        new_file_path = f"{outdir}/{docx_report.name}"
-        _logger.info('$' * 100)
-        os.rename(file_path, new_file_path)
-        args = [self._get_libreoffice_exec(), "--convert-to", "pdf:draw_pdf_Export:{\"MaxImageResolution\":{\"type\":\"long\",\"value\":\"1200\"}}", "--outdir", outdir, new_file_path]
-        _logger.info('*' * 100)
-        _logger.info(args)
-        proc = subprocess.run(args, stderr=subprocess.PIPE, stdout=subprocess.PIPE, timeout=60)
-        _logger.info('*' * 100)
-        _logger.info(proc)
-        # if proc.stderr:
-        #     raise UserError(f"An error occurred when converting to pdf {proc.stderr}")
-        file_path = new_file_path.replace("docx", "pdf")
-        with open(file_path, "rb") as f:
-            pdf_report = BytesIO(f.read())
-        pdf_report.name = docx_report.name.replace("docx", "pdf")
-        os.remove(file_path)
-        os.remove(new_file_path)
-        attachment_id.unlink()
-        return pdf_report
+        return self._convert_to_pdf(docx_report)
 
     def xlsx2pdf(self, xlsx_report) -> BytesIO:
         """Converting xlsx to pdf format."""
-        attachment_id = self.env["ir.attachment"].create(
-            {
-                "name": xlsx_report.name,
-                "datas": encodebytes(xlsx_report.getvalue()),
-            }
+        if self._use_html_pdf_engine():
+            return next(self._convert_batch_to_pdf_html([xlsx_report], combine=False))
+        return self._convert_to_pdf(xlsx_report)
+
+    def _use_html_pdf_engine(self) -> bool:
+        return self.pdf_engine == "wkhtmltopdf" and self._get_template().type == "xlsx"
+
+    def _convert_batch_to_pdf_html(self, reports, combine=None):
+        """
+        Converting xlsx reports to pdf format through html printed by wkhtmltopdf.
+        When reports are merged into one pdf, sheets of all reports are printed at once.
+        """
+        if combine is None:
+            combine = self.pdf_output == "merge" and not self.use_output_cache
+        from ..tools import html_pdf
+        executable = self._get_wkhtmltopdf_exec()
+        try:
+            if combine:
+                pdf_report = html_pdf.xlsx_to_pdf(reports, executable)
+                pdf_report.name = f"{self.name}.pdf"
+                yield pdf_report
+                return
+            for report in reports:
+                pdf_report = html_pdf.xlsx_to_pdf([report], executable)
+                pdf_report.name = f"{os.path.splitext(report.name)[0]}.pdf"
+                yield pdf_report
+        except ConversionError as e:
+            raise UserError(_("An error occurred when converting to pdf: %s", e))
+
+    def _convert_to_pdf(self, report) -> BytesIO:
+        """Converting docx or xlsx report to pdf format with the configured converter."""
+        return list(self._convert_batch_to_pdf([report]))[0]
+
+    def _convert_batch_to_pdf(self, reports):
+        """Converting docx or xlsx reports to pdf format with one call of the configured converter."""
+        try:
+            yield from convert_reports(self._get_converter(), reports)
+        except ConversionError as e:
+            raise UserError(_("An error occurred when converting to pdf: %s", e))
+
+    def _get_converter(self) -> Converter:
+        """
+        Returns pdf converter of current worker configured by system parameters:
+         - report.converter_backend: pool (default), subprocess or stub
+         - report.converter_workers: number of LibreOffice instances in pool of each worker process,
+           with prefork workers the server runs workers times this number of instances
+         - report.converter_max_jobs: number of jobs after which an instance is restarted
+         - report.converter_timeout: seconds for conversion of one file
+         - report.converter_queue_timeout: seconds to wait for a free instance
+        """
+        params = self.env["ir.config_parameter"].sudo()
+        return get_converter(
+            params.get_param("report.converter_backend", "pool"),
+            self._get_libreoffice_exec(),
+            workers=int(params.get_param("report.converter_workers", 2)),
+            max_jobs=int(params.get_param("report.converter_max_jobs", 200)),
+            timeout=int(params.get_param("report.converter_timeout", 60)),
+            queue_timeout=int(params.get_param("report.converter_queue_timeout", 120)),
         )
-        file_path = os.path.abspath(attachment_id._full_path(attachment_id.store_fname))
-        if sys.platform == "win32":
-            outdir = "\\".join(file_path.split("\\")[:-1])
-        else:
-            outdir = "/".join(file_path.split("/")[:-1])
-        new_file_path = f"{outdir}/{xlsx_report.name}"
-        os.rename(file_path, new_file_path)
-        _logger.info("report"*100)
-        _logger.info(file_path, new_file_path)
-        _logger.info(sys.platform)
-        args = [self._get_libreoffice_exec(), "--convert-to", "pdf:draw_pdf_Export:{\"MaxImageResolution\":{\"type\":\"long\",\"value\":\"1200\"}}", "--outdir", outdir, new_file_path]
-        proc = subprocess.run(args, stderr=subprocess.PIPE, stdout=subprocess.PIPE, timeout=10)
-        _logger.info(proc)
-        # if proc.stderr:
-        #     raise UserError(f"An error occurred when converting to pdf {proc.stderr}")
-        file_path = new_file_path.replace("xlsx", "pdf")
-        with open(file_path, "rb") as f:
-            pdf_report = BytesIO(f.read())
-        pdf_report.name = xlsx_report.name.replace("xlsx", "pdf")
-        os.remove(file_path)
-        os.remove(new_file_path)
-        attachment_id.unlink()
-        return pdf_report
 
     @staticmethod
     def _get_libreoffice_exec() -> str:
@@ -450,16 +772,37 @@ class ReportReport(models.Model):
             return "/Applications/LibreOffice.app/Contents/MacOS/soffice"
         raise UserError(_("Unknown operating system for pdf conversion."))
 
-    def _create_zip_archive(self, reports) -> BytesIO:
-        """Creating zip archive with multiple reports."""
-        zip_archive = BytesIO()
-        with ZipFile(zip_archive, "a", ZIP_DEFLATED, False) as zip_file:
-            for index, report in enumerate(reports, 1):
-                report_name = report.name.replace(".", f" ({index}).")
-                zip_file.writestr(report_name, report.getvalue())
-        zip_archive.name = self.name + ".zip"
-        return zip_archive
+    @staticmethod
+    def _get_wkhtmltopdf_exec() -> str:
+        """Return path to wkhtmltopdf executable used by Odoo."""
+        try:
+            return find_in_path("wkhtmltopdf")
+        except OSError:
+            raise UserError(_("wkhtmltopdf is required to convert xlsx reports to pdf with HTML engine."))
+
+    def _create_zip_archive(self, reports, start=1) -> SpooledReport:
+        """
+        Creating zip archive with multiple reports. Every report is added as soon as it's rendered
+        and the archive moves to disk when it grows.
+        """
+        return zip_reports(reports, self.name, start)
+
+    def _merge_zip_archives(self, zip_archives) -> SpooledReport:
+        """Creating zip archive with members of several zip archives."""
+        def members():
+            for zip_archive in zip_archives:
+                with ZipFile(zip_archive) as zip_file:
+                    for member in zip_file.infolist():
+                        with zip_file.open(member) as member_file:
+                            yield member.filename, member_file
+
+        return self._write_zip_archive(members())
+
+    def _write_zip_archive(self, members) -> SpooledReport:
+        """Writes pairs of name and file object to zip archive, already compressed files are stored as is."""
+        return write_zip_archive(self.name + ".zip", members)
 
     def unlink(self):
+        template_cache.invalidate(self.ids)
         for record_id in self:
             self.env["ir.actions.server"].search([("report_id", "=", record_id.id)]).unlink()
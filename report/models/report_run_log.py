@@ -0,0 +1,81 @@
+from datetime import timedelta
+
+from odoo import models, fields, api, tools
+
+from ..tools.timing import STAGES
+
+
+class ReportRunLog(models.Model):
+    _name = "report.run.log"
+    _description = "Report run log"
+    _order = "id desc"
+
+    report_id = fields.Many2one(comodel_name="report.report", string="Report", required=True, index=True,
+                                ondelete="cascade")
+    user_id = fields.Many2one(comodel_name="res.users", string="User")
+    background = fields.Boolean(string="Background", help="Chunk of records rendered by background job.")
+    records_count = fields.Integer(string="Records")
+    bytes_out = fields.Integer(string="Size")
+    duration = fields.Float(string="Duration", digits=(16, 3), help="Seconds of generation of the report.")
+    duration_contexts = fields.Float(string="Contexts", digits=(16, 3), help="Reading records for templates.")
+    duration_template = fields.Float(string="Template", digits=(16, 3), help="Loading template.")
+    duration_render = fields.Float(string="Render", digits=(16, 3), help="Rendering template.")
+    duration_save = fields.Float(string="Save", digits=(16, 3), help="Saving rendered documents.")
+    duration_convert = fields.Float(string="Conversion", digits=(16, 3), help="Converting documents to pdf.")
+    duration_merge = fields.Float(string="Merge", digits=(16, 3), help="Merging documents into pdf or zip.")
+    duration_attachment = fields.Float(string="Attachment", digits=(16, 3), help="Storing files.")
+
+    @api.model
+    def _cron_cleanup(self):
+        """Removes logs older than report.run_log_days days."""
+        days = int(self.env["ir.config_parameter"].sudo().get_param("report.run_log_days", 90))
+        self.search([("create_date", "<", fields.Datetime.now() - timedelta(days=days))]).unlink()
+
+
+class ReportRunStats(models.Model):
+    _name = "report.run.stats"
+    _description = "Report run statistics"
+    _auto = False
+    _order = "duration_p95 desc"
+
+    report_id = fields.Many2one(comodel_name="report.report", string="Report", readonly=True)
+    run_count = fields.Integer(string="Runs", readonly=True)
+    records_count = fields.Integer(string="Records", readonly=True)
+    bytes_out = fields.Float(string="Average size", readonly=True)
+    duration_p50 = fields.Float(string="Duration p50", digits=(16, 3), readonly=True)
+    duration_p95 = fields.Float(string="Duration p95", digits=(16, 3), readonly=True)
+    record_duration_p50 = fields.Float(string="Per record p50", digits=(16, 4), readonly=True)
+    record_duration_p95 = fields.Float(string="Per record p95", digits=(16, 4), readonly=True)
+    duration_contexts = fields.Float(string="Contexts", digits=(16, 3), readonly=True)
+    duration_template = fields.Float(string="Template", digits=(16, 3), readonly=True)
+    duration_render = fields.Float(string="Render", digits=(16, 3), readonly=True)
+    duration_save = fields.Float(string="Save", digits=(16, 3), readonly=True)
+    duration_convert = fields.Float(string="Conversion", digits=(16, 3), readonly=True)
+    duration_merge = fields.Float(string="Merge", digits=(16, 3), readonly=True)
+    duration_attachment = fields.Float(string="Attachment", digits=(16, 3), readonly=True)
+    last_run = fields.Datetime(string="Last run", readonly=True)
+
+    def init(self):
+        """Percentiles of durations of each report, stage columns are averages."""
+        tools.drop_view_if_exists(self.env.cr, self._table)
+        stage_columns = ",\n".join(f"avg(duration_{stage}) AS duration_{stage}" for stage in STAGES)
+        self.env.cr.execute(f"""
+            CREATE OR REPLACE VIEW {self._table} AS (
+                SELECT
+                    report_id AS id,
+                    report_id,
+                    count(*) AS run_count,
+                    sum(records_count) AS records_count,
+                    avg(bytes_out) AS bytes_out,
+                    percentile_cont(0.5) WITHIN GROUP (ORDER BY duration) AS duration_p50,
+                    percentile_cont(0.95) WITHIN GROUP (ORDER BY duration) AS duration_p95,
+                    percentile_cont(0.5) WITHIN GROUP (
+                        ORDER BY duration / greatest(records_count, 1)) AS record_duration_p50,
+                    percentile_cont(0.95) WITHIN GROUP (
+                        ORDER BY duration / greatest(records_count, 1)) AS record_duration_p95,
+                    {stage_columns},
+                    max(create_date) AS last_run
+                FROM report_run_log
+                GROUP BY report_id
+            )
+        """)
@@ -0,0 +1,38 @@
+/** @odoo-module **/
+
+import { registry } from "@web/core/registry";
+
+/**
+ * Shows notifications of report jobs, a ready report gets a button downloading it.
+ */
+export const reportNotificationService = {
+    dependencies: ["bus_service", "notification"],
+
+    start(env, { bus_service, notification }) {
+        bus_service.addEventListener("notification", ({ detail: notifications }) => {
+            for (const { payload, type } of notifications) {
+                if (type !== "report_notification") {
+                    continue;
+                }
+                let close;
+                const buttons = payload.url ? [{
+                    name: payload.url_label,
+                    primary: true,
+                    onClick: () => {
+                        window.location.assign(payload.url);
+                        close();
+                    },
+                }] : [];
+                close = notification.add(payload.message, {
+                    title: payload.title,
+                    type: payload.type,
+                    sticky: payload.sticky,
+                    buttons,
+                });
+            }
+        });
+        bus_service.start();
+    },
+};
+
+registry.category("services").add("report_notification", reportNotificationService);
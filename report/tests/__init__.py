@@ -0,0 +1,8 @@
+from . import test_converter
+from . import test_render
+from . import test_report_attachment
+from . import test_report_benchmark
+from . import test_report_download
+from . import test_report_output_cache
+from . import test_report_workbook
+from . import test_snapshot
@@ -0,0 +1,220 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import types
+from unittest.mock import patch
+
+from odoo.tests.common import BaseCase
+
+from ..tools.converter import (
+    ConversionError, Converter, ConverterPool, StubConverter, SubprocessConverter, UnoConverter, reap_orphans,
+)
+
+
+class HangingConverter(StubConverter):
+    """Converter whose job runs until it is killed."""
+
+    def __init__(self):
+        super().__init__()
+        self.killed = threading.Event()
+
+    def convert(self, paths, outdir, timeout=None) -> list:
+        self.killed.wait(10)
+        raise ConversionError("Killed.")
+
+    def kill(self):
+        self.killed.set()
+
+
+class BrokenConverter(StubConverter):
+    """Converter which can't start."""
+
+    def start(self):
+        raise ConversionError("Can't start.")
+
+
+class TestConverterPool(BaseCase):
+
+    def setUp(self):
+        super().setUp()
+        self.outdir = tempfile.mkdtemp(prefix="report-test-")
+        self.addCleanup(shutil.rmtree, self.outdir, True)
+        self.path = os.path.join(self.outdir, "report.docx")
+        with open(self.path, "wb") as f:
+            f.write(b"docx")
+        self.created = []
+
+    def _factory(self, converter_class):
+        def factory(index):
+            converter = converter_class()
+            self.created.append(converter)
+            return converter
+        return factory
+
+    def test_convert(self):
+        pool = ConverterPool(self._factory(StubConverter), size=1)
+        result = pool.convert([self.path], self.outdir)
+        self.assertEqual(result, [os.path.join(self.outdir, "report.pdf")])
+        with open(result[0], "rb") as f:
+            self.assertTrue(f.read().startswith(b"%PDF"))
+
+    def test_recycle_after_max_jobs(self):
+        pool = ConverterPool(self._factory(StubConverter), size=1, max_jobs=2)
+        for _index in range(5):
+            pool.convert([self.path], self.outdir)
+        self.assertEqual(len(self.created), 3)
+
+    def test_queue_timeout(self):
+        pool = ConverterPool(lambda index: StubConverter(delay=1), size=1, queue_timeout=0.1)
+        thread = threading.Thread(target=pool.convert, args=([self.path], self.outdir))
+        thread.start()
+        try:
+            with self.assertRaises(ConversionError):
+                while thread.is_alive():
+                    pool.convert([self.path], self.outdir)
+        finally:
+            thread.join()
+
+    def test_timeout(self):
+        pool = ConverterPool(self._factory(HangingConverter), size=1, timeout=0.1, fallback=StubConverter())
+        with self.assertRaises(ConversionError):
+            pool.convert([self.path], self.outdir)
+        self.assertTrue(self.created[0].killed.is_set())
+        # Killed worker is replaced by a new one.
+        self.assertRaises(ConversionError, pool.convert, [self.path], self.outdir)
+        self.assertEqual(len(self.created), 2)
+
+    def test_fallback(self):
+        pool = ConverterPool(self._factory(BrokenConverter), size=1, fallback=StubConverter())
+        result = pool.convert([self.path], self.outdir)
+        self.assertTrue(os.path.exists(result[0]))
+        pool = ConverterPool(self._factory(BrokenConverter), size=1)
+        self.assertRaises(ConversionError, pool.convert, [self.path], self.outdir)
+
+    def test_stop_removes_profiles(self):
+        profiles_dir = tempfile.mkdtemp(prefix="report-test-profiles-")
+        fallback = SubprocessConverter("soffice")
+        fallback.profile_dir = tempfile.mkdtemp(prefix="report-test-profile-")
+        pool = ConverterPool(self._factory(StubConverter), size=1, fallback=fallback, profiles_dir=profiles_dir)
+        pool.convert([self.path], self.outdir)
+        profile_dir = fallback.profile_dir
+        pool.stop()
+        self.assertFalse(os.path.exists(profiles_dir))
+        self.assertFalse(os.path.exists(profile_dir))
+        self.assertIsNone(fallback.profile_dir)
+
+
+class FakeDocument:
+
+    def __init__(self, spreadsheet):
+        self.spreadsheet = spreadsheet
+        self.closed = False
+        self.stored = None
+
+    def supportsService(self, name):
+        return self.spreadsheet and name == "com.sun.star.sheet.SpreadsheetDocument"
+
+    def storeToURL(self, url, properties):
+        self.stored = {prop.Name: prop.Value for prop in properties}
+        with open(url[len("file://"):], "wb") as f:
+            f.write(b"%PDF")
+
+    def close(self, deliver_ownership):
+        self.closed = True
+
+
+class FakeDesktop:
+
+    def __init__(self):
+        self.documents = []
+
+    def loadComponentFromURL(self, url, frame, flags, properties):
+        if url.endswith(".broken"):
+            return None
+        document = FakeDocument(url.endswith(".xlsx"))
+        self.documents.append(document)
+        return document
+
+
+class TestUnoConverter(BaseCase):
+    """Conversion over UNO with a stand-in for the LibreOffice bridge."""
+
+    def setUp(self):
+        super().setUp()
+        self.outdir = tempfile.mkdtemp(prefix="report-test-")
+        self.addCleanup(shutil.rmtree, self.outdir, True)
+        uno = types.ModuleType("uno")
+        uno.systemPathToFileUrl = lambda path: f"file://{path}"
+        uno.Any = lambda type_name, value: value
+        beans = types.ModuleType("com.sun.star.beans")
+        beans.PropertyValue = types.SimpleNamespace
+        modules = {
+            "uno": uno,
+            "com": types.ModuleType("com"),
+            "com.sun": types.ModuleType("com.sun"),
+            "com.sun.star": types.ModuleType("com.sun.star"),
+            "com.sun.star.beans": beans,
+        }
+        patcher = patch.dict(sys.modules, modules)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.converter = UnoConverter("soffice", os.path.join(self.outdir, "profile"))
+        self.converter.desktop = FakeDesktop()
+
+    def _path(self, name) -> str:
+        path = os.path.join(self.outdir, name)
+        with open(path, "wb") as f:
+            f.write(b"document")
+        return path
+
+    def test_convert(self):
+        results = self.converter.convert([self._path("a.docx"), self._path("b.xlsx")], self.outdir)
+        self.assertEqual(results, [os.path.join(self.outdir, "a.pdf"), os.path.join(self.outdir, "b.pdf")])
+        writer, calc = self.converter.desktop.documents
+        self.assertEqual(writer.stored["FilterName"], "writer_pdf_Export")
+        self.assertEqual(calc.stored["FilterName"], "calc_pdf_Export")
+        self.assertTrue(writer.closed and calc.closed)
+        self.assertTrue(all(os.path.exists(result) for result in results))
+
+    def test_document_not_loaded(self):
+        with self.assertRaises(ConversionError):
+            self.converter.convert([self._path("a.broken")], self.outdir)
+
+    def test_stop_removes_profile(self):
+        os.makedirs(self.converter.profile_dir)
+        self.converter.process = subprocess.Popen(["sleep", "0.1"], start_new_session=True)
+        self.converter.stop()
+        self.assertIsNone(self.converter.process)
+        self.assertIsNone(self.converter.desktop)
+        self.assertFalse(os.path.exists(self.converter.profile_dir))
+
+
+class TestConverterProcesses(BaseCase):
+
+    def test_abstract_converter(self):
+        with self.assertRaises(TypeError):
+            Converter()
+
+    def test_reap_orphans(self):
+        root = tempfile.mkdtemp(prefix="report-test-")
+        self.addCleanup(shutil.rmtree, root, True)
+        process = subprocess.Popen(["true"])
+        process.wait()
+        orphan_dir = os.path.join(root, f"report-lo-pool-{process.pid}-x")
+        own_dir = os.path.join(root, f"report-lo-pool-{os.getpid()}-x")
+        os.makedirs(os.path.join(orphan_dir, "0"))
+        os.makedirs(own_dir)
+        # Stands in for LibreOffice left running with a profile of the dead process.
+        orphan = subprocess.Popen(
+            [sys.executable, "-c", "import time; print(flush=True); time.sleep(30)", os.path.join(orphan_dir, "0")],
+            stdout=subprocess.PIPE,
+        )
+        self.addCleanup(orphan.stdout.close)
+        orphan.stdout.readline()
+        reap_orphans(root)
+        self.assertFalse(os.path.exists(orphan_dir))
+        self.assertTrue(os.path.exists(own_dir))
+        self.assertEqual(orphan.wait(5), -9)
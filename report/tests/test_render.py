@@ -0,0 +1,37 @@
+import os
+import threading
+
+from odoo.tests.common import BaseCase
+
+from ..tools import render
+from ..tools.lru import LRUCache
+
+
+class TestParallelRender(BaseCase):
+
+    def test_threads_render_sequentially(self):
+        started = threading.Event()
+        stop = threading.Event()
+
+        def wait():
+            started.set()
+            stop.wait(5)
+
+        thread = threading.Thread(target=wait)
+        thread.start()
+        try:
+            started.wait(5)
+            self.assertFalse(render.parallel_available())
+        finally:
+            stop.set()
+            thread.join()
+
+    def test_forked_cache_lock(self):
+        cache = LRUCache()
+        with cache._lock:
+            pid = os.fork()
+            if not pid:
+                # Lock held by the parent at fork is replaced in the child.
+                os._exit(0 if cache._lock.acquire(timeout=1) else 1)
+            _pid, status = os.waitpid(pid, 0)
+        self.assertEqual(os.waitstatus_to_exitcode(status), 0)
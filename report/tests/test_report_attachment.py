@@ -0,0 +1,53 @@
+import base64
+import os
+from io import BytesIO
+
+from odoo.tests.common import TransactionCase
+
+from ..tools.files import SPOOL_MAX_SIZE, SpooledReport
+
+
+class TestReportAttachment(TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.report_id = cls.env["report.report"].create({
+            "name": "Test report",
+            "model_id": cls.env.ref("base.model_res_partner").id,
+            "report_type": "txt",
+            "template": base64.b64encode(b"template"),
+        })
+
+    def _read(self, attachment_id) -> bytes:
+        return self.report_id._open_attachment(attachment_id).getvalue()
+
+    def test_small_report(self):
+        report_file = BytesIO(b"report of a record")
+        report_file.name = "Test report.txt"
+        attachment_id = self.report_id._create_attachment(report_file)
+        self.assertEqual(attachment_id.raw, b"report of a record")
+        self.assertEqual(attachment_id.file_size, len(b"report of a record"))
+        self.assertEqual(attachment_id.mimetype, "text/plain")
+        self.assertEqual(self._read(attachment_id), b"report of a record")
+
+    def test_big_report(self):
+        if self.env["ir.attachment"]._storage() != "file":
+            self.skipTest("Big reports are streamed to file storage only.")
+        content = os.urandom(SPOOL_MAX_SIZE + 1)
+        report_file = SpooledReport("Test report.zip")
+        report_file.write(content)
+        attachment_id = self.report_id._create_attachment(report_file)
+        self.assertTrue(attachment_id.store_fname)
+        self.assertEqual(attachment_id.file_size, len(content))
+        self.assertEqual(attachment_id.mimetype, "application/zip")
+        self.assertEqual(attachment_id.raw, content)
+        self.assertEqual(self._read(attachment_id), content)
+
+        # Report already stored in an attachment shares its file.
+        report_file = self.report_id._open_attachment(attachment_id)
+        copy_attachment_id = self.report_id._create_attachment(report_file)
+        self.assertNotEqual(copy_attachment_id, attachment_id)
+        self.assertEqual(copy_attachment_id.store_fname, attachment_id.store_fname)
+        self.assertEqual(copy_attachment_id.checksum, attachment_id.checksum)
+        self.assertEqual(self._read(copy_attachment_id), content)
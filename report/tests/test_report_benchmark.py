@@ -0,0 +1,93 @@
+import logging
+from unittest import SkipTest
+
+from odoo.tests.common import TransactionCase, tagged
+
+_logger = logging.getLogger(__name__)
+
+
+@tagged("-standard", "report_benchmark")
+class TestReportBenchmark(TransactionCase):
+    """
+    Times report.report.run of shipment details reports on generated pickings, durations of
+    stages are logged from run log. Runs only when selected:
+
+        odoo-bin -d db -i report --test-tags report_benchmark --stop-after-init
+    """
+    SIZES = [1, 10, 100]
+    LINES_PER_PICKING = 4
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        picking_model = cls.env["stock.picking"]
+        if "odm_company_id" not in picking_model._fields:
+            raise SkipTest("Pickings have no odm_company_id field.")
+        line_model = cls.env[picking_model._fields["move_line_ids_without_package"].comodel_name]
+        cls.picking_type_id = cls.env.ref("stock.picking_type_out")
+        cls.partner_id = cls.env["res.partner"].create({
+            "name": "Benchmark customer",
+            "street": "Second street 1",
+            "city": "Warsaw",
+            "zip": "00-001",
+            "country_id": cls.env.ref("base.pl").id,
+            "phone": "+48 000 000 000",
+        })
+        cls.product_id = cls.env["product.product"].create({
+            "name": "Benchmark product",
+            "detailed_type": "product",
+            "tracking": "lot",
+        })
+        cls.lot_model = cls.env[line_model._fields["lot_id"].comodel_name]
+        cls.package_model = cls.env[line_model._fields["result_package_id"].comodel_name]
+        cls.line_model = line_model
+
+    def _create_pickings(self, size):
+        picking_ids = self.env["stock.picking"].create([{
+            "picking_type_id": self.picking_type_id.id,
+            "location_id": self.picking_type_id.default_location_src_id.id,
+            "location_dest_id": self.env.ref("stock.stock_location_customers").id,
+            "partner_id": self.partner_id.id,
+            "origin": f"BENCH{index:05d}",
+        } for index in range(size)])
+        lot_ids = self.lot_model.create([{
+            "name": f"BENCH{picking_id.id:06d}{line}",
+            "product_id": self.product_id.id,
+            "company_id": self.env.company.id,
+        } for picking_id in picking_ids for line in range(self.LINES_PER_PICKING)])
+        package_ids = self.package_model.create([
+            {"name": f"BENCHPACK{picking_id.id:06d}-{package}"} for picking_id in picking_ids for package in range(2)
+        ])
+        self.line_model.create([{
+            "picking_id": picking_id.id,
+            "product_id": self.product_id.id,
+            "product_uom_id": self.product_id.uom_id.id,
+            "location_id": picking_id.location_id.id,
+            "location_dest_id": picking_id.location_dest_id.id,
+            "lot_id": lot_ids[index * self.LINES_PER_PICKING + line].id,
+            "result_package_id": package_ids[index * 2 + line % 2].id,
+            "qty_done": 1,
+        } for index, picking_id in enumerate(picking_ids) for line in range(self.LINES_PER_PICKING)])
+        return picking_ids
+
+    def _run(self, report_id, picking_ids):
+        """Runs report like its print menu action does."""
+        report_id.write({"async_threshold": 0, "use_output_cache": False})
+        action_id = self.env["ir.actions.server"].search([("report_id", "=", report_id.id)], limit=1)
+        action_id.with_context(
+            active_model=picking_ids._name, active_id=picking_ids[0].id, active_ids=picking_ids.ids,
+        ).run()
+        run_log_id = self.env["report.run.log"].search([("report_id", "=", report_id.id)], order="id desc", limit=1)
+        self.assertEqual(run_log_id.records_count, len(picking_ids))
+        _logger.info(
+            "Benchmark %s, %s pickings: %.3fs, contexts %.3fs, render %.3fs, convert %.3fs, merge %.3fs, "
+            "attachment %.3fs, %s bytes", report_id.name, len(picking_ids), run_log_id.duration,
+            run_log_id.duration_contexts, run_log_id.duration_render, run_log_id.duration_convert,
+            run_log_id.duration_merge, run_log_id.duration_attachment, run_log_id.bytes_out,
+        )
+
+    def test_shipment_details(self):
+        for xmlid in ("report.shipment_details_xlsx_report", "report.shipment_details_pdf_report"):
+            for size in self.SIZES:
+                with self.subTest(report=xmlid, size=size):
+                    self._run(self.env.ref(xmlid), self._create_pickings(size))
@@ -0,0 +1,105 @@
+import base64
+import os
+import time
+from datetime import timedelta
+from io import BytesIO
+
+from odoo import fields
+from odoo.tests.common import HttpCase, TransactionCase, new_test_user
+
+
+class ReportDownloadCase(TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.report_id = cls.env["report.report"].create({
+            "name": "Test report",
+            "model_id": cls.env.ref("base.model_res_partner").id,
+            "report_type": "txt",
+            "template": base64.b64encode(b"template"),
+        })
+        cls.user_id = new_test_user(cls.env, "report_download_user", password="report_download_user")
+        cls.other_user_id = new_test_user(cls.env, "report_download_other", password="report_download_other")
+
+    def _create_download(self, content=b"report"):
+        report_file = BytesIO(content)
+        report_file.name = "report.txt"
+        download_id = self.env["report.download"].with_user(self.user_id)._create_download(self.report_id, report_file)
+        self.addCleanup(self._remove_file, download_id._get_path())
+        return download_id
+
+    @staticmethod
+    def _remove_file(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    def _expire(download_id):
+        download_id.sudo().expiration = fields.Datetime.now() - timedelta(seconds=1)
+
+
+class TestReportDownload(ReportDownloadCase):
+
+    def test_token(self):
+        download_id = self._create_download()
+        token = download_id._get_token()
+        self.assertTrue(download_id._check_token(token))
+        self.assertFalse(download_id._check_token(""))
+        self.assertFalse(download_id._check_token("0" * len(token)))
+
+    def test_token_of_other_download(self):
+        download_id = self._create_download()
+        other_download_id = self._create_download()
+        self.assertFalse(download_id._check_token(other_download_id._get_token()))
+
+    def test_expired_download(self):
+        download_id = self._create_download()
+        token = download_id._get_token()
+        self._expire(download_id)
+        # Expiration is a part of signature, an old token doesn't match either.
+        self.assertFalse(download_id._check_token(token))
+        self.assertFalse(download_id._check_token(download_id._get_token()))
+
+    def test_cron_cleanup(self):
+        download_id = self._create_download()
+        expired_download_id = self._create_download()
+        path = expired_download_id._get_path()
+        self._expire(expired_download_id)
+        old = time.time() - self.env["report.download"]._get_lifetime() - 1
+        os.utime(path, (old, old))
+        self.env["report.download"]._cron_cleanup()
+        self.assertFalse(expired_download_id.exists())
+        self.assertFalse(os.path.exists(path))
+        self.assertTrue(download_id.exists())
+        self.assertTrue(os.path.exists(download_id._get_path()))
+
+
+class TestReportDownloadController(HttpCase, ReportDownloadCase):
+
+    def test_download(self):
+        download_id = self._create_download()
+        self.authenticate("report_download_user", "report_download_user")
+        response = self.url_open(download_id._get_url())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b"report")
+
+    def test_tampered_token(self):
+        download_id = self._create_download()
+        self.authenticate("report_download_user", "report_download_user")
+        response = self.url_open(f"/report_download/{download_id.id}/{'0' * len(download_id._get_token())}")
+        self.assertEqual(response.status_code, 404)
+
+    def test_expired_download(self):
+        download_id = self._create_download()
+        url = download_id._get_url()
+        self._expire(download_id)
+        self.authenticate("report_download_user", "report_download_user")
+        self.assertEqual(self.url_open(url).status_code, 404)
+
+    def test_other_user(self):
+        download_id = self._create_download()
+        self.authenticate("report_download_other", "report_download_other")
+        self.assertEqual(self.url_open(download_id._get_url()).status_code, 404)
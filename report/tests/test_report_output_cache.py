@@ -0,0 +1,52 @@
+import base64
+
+from odoo.tests.common import TransactionCase
+
+
+class TestReportOutputCache(TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.report_id = cls.env["report.report"].create({
+            "name": "Test report",
+            "model_id": cls.env.ref("base.model_res_partner").id,
+            "report_type": "txt",
+            "template": base64.b64encode(b"{{ record.name }}"),
+            "use_output_cache": True,
+        })
+        cls.partner_id = cls.env["res.partner"].create({"name": "Test partner"})
+        cls.company_id = cls.env["res.company"].create({"name": "Test company"})
+        cls.env.user.company_ids |= cls.company_id
+
+    def _get_key(self, env) -> str:
+        return env["report.output.cache"]._get_keys(
+            self.report_id.with_env(env), self.partner_id.with_env(env)
+        )[0]
+
+    def test_same_environment(self):
+        self.assertEqual(self._get_key(self.env), self._get_key(self.env))
+
+    def test_other_company(self):
+        env = self.env(context=dict(self.env.context, allowed_company_ids=[self.company_id.id]))
+        self.assertEqual(env.company, self.company_id)
+        self.assertNotEqual(self._get_key(env), self._get_key(self.env))
+
+    def test_other_language(self):
+        self.env["res.lang"]._activate_lang("fr_FR")
+        english_env = self.env(context=dict(self.env.context, lang="en_US"))
+        french_env = self.env(context=dict(self.env.context, lang="fr_FR"))
+        self.assertNotEqual(self._get_key(french_env), self._get_key(english_env))
+
+    def test_other_user(self):
+        user_id = self.env["res.users"].create({"name": "Test user", "login": "report_output_cache_user"})
+        self.assertNotEqual(self._get_key(self.env(user=user_id)), self._get_key(self.env))
+
+    def test_lookup_misses_other_company(self):
+        cache_model = self.env["report.output.cache"]
+        key = self._get_key(self.env)
+        attachment_id = self.env["ir.attachment"].create({"name": "report.txt", "raw": b"Test partner"})
+        cache_model._store(self.report_id, self.partner_id, key, attachment_id)
+        self.assertIn(key, cache_model._lookup([key]))
+        env = self.env(context=dict(self.env.context, allowed_company_ids=[self.company_id.id]))
+        self.assertFalse(cache_model._lookup([self._get_key(env)]))
@@ -0,0 +1,40 @@
+import base64
+import os
+
+from odoo.exceptions import UserError
+from odoo.tests.common import TransactionCase
+
+TEMPLATE_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "templates", "ShipmentDetails.xlsx")
+
+
+class TestReportWorkbook(TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        with open(TEMPLATE_PATH, "rb") as f:
+            template = base64.b64encode(f.read())
+        cls.report_id = cls.env["report.report"].create({
+            "name": "Test workbook",
+            "model_id": cls.env.ref("base.model_res_partner").id,
+            "report_type": "xlsx",
+            "xlsx_output": "sheets",
+            "template": template,
+        })
+        cls.partner_id = cls.env["res.partner"].create({"name": "Test partner"})
+
+    def test_single_workbook(self):
+        self.assertTrue(self.report_id._use_single_workbook())
+        self.report_id.is_single = True
+        self.assertFalse(self.report_id._use_single_workbook())
+
+    def test_sheet_name(self):
+        context = {"record": self.partner_id, "record_number": 0}
+        self.assertEqual(self.report_id._get_sheet_name(context), self.partner_id.display_name)
+        self.report_id.sheet_name_expression = False
+        self.assertEqual(self.report_id._get_sheet_name(context), "1")
+
+    def test_wrong_sheet_name_expression(self):
+        self.report_id.sheet_name_expression = "record.missing_field"
+        with self.assertRaisesRegex(UserError, "record.missing_field.*Test workbook"):
+            self.report_id._get_sheet_name({"record": self.partner_id, "record_number": 0})
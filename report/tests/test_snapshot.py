@@ -0,0 +1,101 @@
+import pickle
+from io import BytesIO
+from types import SimpleNamespace
+
+import jinja2
+
+from odoo.tests.common import BaseCase, TransactionCase
+
+from ..tools import render
+from ..tools.snapshot import SnapshotError, build_payload, template_paths
+
+
+def paths(source) -> dict:
+    return template_paths([(jinja2.Environment(), source)])
+
+
+def fake_template(source) -> SimpleNamespace:
+    return SimpleNamespace(paths=lambda: paths(source))
+
+
+class TestPathCollector(BaseCase):
+
+    def test_attributes(self):
+        self.assertEqual(paths("{{ record.partner_id.name }} {{ record['ref'] }}"), {
+            "record": {"partner_id": {"name": {}}, "ref": {}},
+        })
+
+    def test_loop_and_assignment(self):
+        self.assertEqual(paths(
+            "{% for line in record.line_ids %}{{ line.product_id.name }}{% endfor %}"
+            "{% set partner = record.partner_id %}{{ partner.city }}"
+            "{% with lot = record.lot_id %}{{ lot.name }}{% endwith %}"
+        ), {
+            "record": {
+                "line_ids": {"product_id": {"name": {}}},
+                "partner_id": {"city": {}},
+                "lot_id": {"name": {}},
+            },
+        })
+
+    def test_method_call(self):
+        self.assertEqual(paths("{{ record.display() }}"), {"record": {"display": {}}})
+
+    def test_image_filter(self):
+        tree = paths("{{ record.partner_id|replace_image('logo') }}")
+        self.assertIn("image_1920", tree["record"]["partner_id"])
+        self.assertIn("image_128", tree["record"]["partner_id"])
+
+
+class TestBuildPayload(BaseCase):
+
+    def test_plain_copy(self):
+        record = SimpleNamespace(name="WH/OUT/00001", partner_id=SimpleNamespace(name="Partner", city="Minsk"))
+        payload = build_payload(
+            {"record": record, "record_number": 3, "unused": object()},
+            paths("{{ record.name }} {{ record.partner_id.name }} {{ record_number }}"),
+        )
+        self.assertEqual(set(payload), {"record", "record_number"})
+        self.assertEqual(payload["record"].partner_id.name, "Partner")
+        self.assertFalse(hasattr(payload["record"].partner_id, "city"))
+        payload = pickle.loads(pickle.dumps(payload))
+        self.assertEqual(payload["record"].name, "WH/OUT/00001")
+
+    def test_method_call(self):
+        record = SimpleNamespace(display=lambda: "record")
+        with self.assertRaises(SnapshotError):
+            build_payload({"record": record}, paths("{{ record.display() }}"))
+        self.assertIsNone(render.build_payloads(fake_template("{{ record.display() }}"), [{"record": record}]))
+
+    def test_item_of_object(self):
+        env = SimpleNamespace()
+        self.assertIsNone(render.build_payloads(
+            fake_template("{{ env['res.partner'].name }}"), [{"env": env}],
+        ))
+
+    def test_image(self):
+        from PIL import Image
+        image = Image.new("RGB", (4, 2), "white")
+        fp = BytesIO()
+        image.save(fp, "png")
+        # Pickled PIL images lose their file, the copy is opened again from png data.
+        payload = pickle.loads(pickle.dumps(build_payload({"image": Image.open(BytesIO(fp.getvalue()))}, {"image": {}})))
+        self.assertEqual(payload["image"].size, (4, 2))
+        self.assertEqual(payload["image"].format, "PNG")
+
+
+class TestBuildPayloadRecords(TransactionCase):
+
+    def test_records(self):
+        partner = self.env["res.partner"].create({"name": "Partner", "child_ids": [(0, 0, {"name": "Child"})]})
+        payload = build_payload(
+            {"record": partner},
+            paths("{% for child in record.child_ids %}{{ child.name }}{% endfor %}{{ record.missing }}"),
+        )
+        self.assertEqual([child.name for child in payload["record"].child_ids], ["Child"])
+        self.assertFalse(hasattr(payload["record"], "missing"))
+
+    def test_record_method(self):
+        partner = self.env["res.partner"].create({"name": "Partner"})
+        for source in ("{{ record.name_get() }}", "{{ record.child_ids.mapped('name') }}"):
+            self.assertIsNone(render.build_payloads(fake_template(source), [{"record": partner}]), source)
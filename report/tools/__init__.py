@@ -0,0 +1,6 @@
+"""
+Helpers used by report models that don't depend on the ORM.
+
+Modules of this package must stay importable without Odoo so they can be used
+from worker processes and benchmarks.
+"""
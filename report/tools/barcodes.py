@@ -0,0 +1,61 @@
+"""
+Barcode images shared by all templates of a worker.
+
+Rendered png bytes are kept in a bounded cache, so a lot or product code which repeats
+across lines and records is rasterised once.
+"""
+from io import BytesIO
+
+from .lru import LRUCache
+
+cache = LRUCache(max_entries=4096, max_size=32 * 1024 * 1024)
+
+
+def _options(module_width, module_height, write_text, dpi) -> dict:
+    if write_text:
+        options = {
+            "write_text": True,
+            "quiet_zone": 0,
+            "dpi": dpi,
+            "font_size": 10,
+            "text_distance": 0.5,
+        }
+    else:
+        options = {
+            "write_text": False,
+            "quiet_zone": 0,
+            "dpi": dpi,
+            "text_distance": 0,
+            "font_size": 0,
+        }
+    if module_width is not None:
+        options["module_width"] = module_width
+    if module_height is not None:
+        options["module_height"] = module_height
+    return options
+
+
+def _render(symbology, value, module_width, module_height, write_text, dpi) -> bytes:
+    import barcode
+    from barcode.writer import ImageWriter
+    EAN = barcode.get_barcode_class(symbology)
+    my_ean = EAN(value, writer=ImageWriter(), add_checksum=False)
+    fp = BytesIO()
+    my_ean.write(fp, options=_options(module_width, module_height, write_text, dpi))
+    return fp.getvalue()
+
+
+def barcode_png(symbology, value, module_width=None, module_height=None, write_text=False, dpi=300) -> bytes:
+    """Returns png image of barcode, module sizes are in millimeters, None keeps defaults of symbology."""
+    value = str(value)
+    key = (symbology, value, module_width, module_height, bool(write_text), dpi)
+    return cache.get_or_create(
+        key,
+        lambda: _render(symbology, value, module_width, module_height, write_text, dpi),
+        len,
+    )
+
+
+def stats() -> dict:
+    """Returns hits, misses and usage of barcode cache."""
+    return cache.stats()
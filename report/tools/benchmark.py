@@ -0,0 +1,406 @@
+"""
+Benchmark of the rendering pipeline with the bundled templates and synthetic records.
+
+Runs the stages of report.report.run outside of Odoo: context building, template load,
+render, pdf conversion, merge and storing of the final file. Conversion and merge use the
+same functions as the model, results tell which merge was used. Contexts are built from
+synthetic records and the file is stored in a temporary filestore without an attachment,
+tests/test_report_benchmark.py times report.report.run on generated pickings in Odoo.
+Every case runs in a forked process, so peak RSS belongs to the case. Results are written
+as JSON and can be compared with results of another commit:
+
+    cd report
+    python -m tools.benchmark --sizes 1,100,1000 --output after.json --compare before.json
+
+With --startup it measures import time and memory of the modules which report.models
+imports when Odoo loads the registry, with engine libraries loaded on demand and eagerly.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+from base64 import encodebytes
+from datetime import datetime
+from io import BytesIO
+from types import SimpleNamespace
+
+from PIL import Image
+
+from . import render, template_cache, timing
+from .barcodes import barcode_png
+from .converter import ConversionError, convert_reports, create_converter
+from .files import copy_to_path, file_checksum, merge_reports
+
+TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "templates")
+TEMPLATES = ["PNCS41XX.docx", "MACSNCS41XX.docx", "ShipmentDetails.xlsx"]
+REPORT_TYPES = ["docx", "xlsx", "pdf", "txt"]
+SIZES = [1, 10, 100, 1000, 5000]
+LINES_PER_PICKING = 4
+# Modules imported by report.models when Odoo loads the registry.
+MODEL_IMPORTS = [
+    "tools.barcodes", "tools.converter", "tools.files", "tools.formatting", "tools.render",
+    "tools.template_cache", "tools.timing",
+]
+# Libraries of rendering engines, imported at registry load before engines were loaded on demand.
+ENGINE_LIBRARIES = [
+    "docx", "docxtpl", "xltpl.writerx", "pdfkit", "xlsx2html", "num2words", "barcode", "barcode.writer", "PIL.Image",
+]
+STARTUP_SCRIPT = """
+import importlib, json, sys, time
+
+def rss():
+    with open("/proc/self/status") as f:
+        return next(int(line.split()[1]) for line in f if line.startswith("VmRSS:"))
+
+modules, libraries = json.loads(sys.argv[1]), json.loads(sys.argv[2])
+rss_before = rss()
+started = time.perf_counter()
+for module in modules:
+    importlib.import_module(module)
+print(json.dumps({
+    "import_time": time.perf_counter() - started,
+    "rss_kb": rss() - rss_before,
+    "engine_libraries_loaded": [library for library in libraries if library in sys.modules],
+}))
+"""
+
+
+def _image(size, color) -> bytes:
+    """Returns base64 png like an image field of Odoo."""
+    fp = BytesIO()
+    Image.new("RGB", size, color).save(fp, "png")
+    return encodebytes(fp.getvalue())
+
+
+def _environment() -> SimpleNamespace:
+    partner = SimpleNamespace(image_1920=_image((256, 128), "navy"))
+    company = SimpleNamespace(name="YourCompany", partner_id=partner)
+    return SimpleNamespace(company=company, user=SimpleNamespace(company_id=company))
+
+
+def _product_record(index) -> SimpleNamespace:
+    manufacturer = SimpleNamespace(label_image_1920=_image((128, 64), "green") if index % 2 else False)
+    return SimpleNamespace(
+        id=index,
+        name=f"SN{index:08d}",
+        product_id=SimpleNamespace(
+            name=f"Product {index % 50}",
+            odm_name=f"ODM product {index % 50}" if index % 3 else False,
+            barcode=f"{4600000000000 + index % 50}",
+            manufacturer_id=manufacturer,
+        ),
+        mac_address=f"00:1A:2B:{index >> 16 & 255:02X}:{index >> 8 & 255:02X}:{index & 255:02X}",
+    )
+
+
+def _picking_values(index) -> dict:
+    """Returns values which report.report adds to context of shipment details report."""
+    packages = {}
+    for line in range(LINES_PER_PICKING):
+        package_name = f"PACK{index:06d}-{line % 2}"
+        lot_name = f"LOT{index:06d}{line}"
+        packages.setdefault(package_name, []).append({
+            "package_name": package_name,
+            "package_weight": 1.5 * (line % 2 + 1),
+            "product_name": f"ODM product {line}",
+            "lot_name": lot_name,
+            "barcode": Image.open(BytesIO(barcode_png("code39", lot_name))),
+        })
+    return {
+        "partner_address": "Main street 1, Minsk, 220000, Belarus",
+        "recipient_data": f"Customer {index}, Contact {index}, +375 29 000 00 00",
+        "recipient_address": f"Contact {index}, Second street {index}, Warsaw, 00-001, Poland",
+        "packages": dict(sorted(packages.items())),
+        "image": Image.open(BytesIO(barcode_png("code39", "LOGO"))),
+        "shipping_weight": 4.5,
+    }
+
+
+def _picking_record(index) -> SimpleNamespace:
+    return SimpleNamespace(
+        id=index,
+        name=f"WH/OUT/{index:05d}",
+        odm_company_id=SimpleNamespace(name=False),
+        origin=f"S{index:05d}",
+        date_done=datetime(2024, 1, 1, 12, 0),
+    )
+
+
+def build_contexts(template_name, size):
+    """Yields render contexts of synthetic records like report.report._prepare_contexts."""
+    env = _environment()
+    for index in range(size):
+        if template_name == "ShipmentDetails.xlsx":
+            context = dict(env=env, user=env.user, record=_picking_record(index), record_number=index)
+            context.update(_picking_values(index))
+        else:
+            context = dict(env=env, user=env.user, record=_product_record(index), record_number=index)
+        yield context
+
+
+def peak_rss() -> int:
+    """Returns peak resident memory of process and its children in kilobytes."""
+    return max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+
+
+def _pypdf_merge(pdf_datas) -> bytes:
+    """Returns one pdf with pages of all pdf contents like odoo.tools.pdf.merge_pdf."""
+    from pypdf import PdfWriter
+    writer = PdfWriter()
+    for pdf_data in pdf_datas:
+        writer.append(BytesIO(pdf_data))
+    pdf_report = BytesIO()
+    writer.write(pdf_report)
+    return pdf_report.getvalue()
+
+
+def pdf_merger() -> tuple:
+    """
+    Returns name and function merging pdf contents: merge_pdf of Odoo when it's importable,
+    otherwise pypdf. Pdf reports are zipped like with pdf output zip when neither is installed.
+    """
+    try:
+        from odoo.tools.pdf import merge_pdf
+        return "odoo", merge_pdf
+    except ImportError:
+        pass
+    try:
+        import pypdf  # noqa: F401
+        return "pypdf", _pypdf_merge
+    except ImportError:
+        return "zip", None
+
+
+def run_case(template_name, report_type, size, converter_options, workers, filestore, wkhtmltopdf=None,
+             sheets=False) -> dict:
+    """
+    Runs pipeline once and returns durations of stages, peak memory and throughput.
+    Xlsx reports are printed by wkhtmltopdf when its executable is given. With sheets
+    xlsx reports of all records are rendered into one workbook.
+    """
+    name = os.path.splitext(template_name)[0]
+    with timing.measure() as timings:
+        with timing.stage("template"):
+            with open(os.path.join(TEMPLATES_DIR, template_name), "rb") as f:
+                template = template_cache.Template(f.read())
+            if template.type == "xlsx":
+                with template.lock:
+                    template.book_writer()
+        render_type = template.type if report_type == "pdf" else report_type
+        jinja_env = render.get_jinja_env()
+        with timing.stage("contexts"):
+            contexts = list(build_contexts(template_name, size))
+        with timing.stage("render"):
+            reports = None
+            if sheets and report_type == "xlsx":
+                sheet_names = [context["record"].name for context in contexts]
+                reports = [render.render_xlsx_book(template, contexts, sheet_names, name)]
+            elif workers > 1 and size > 1 and render.parallel_available():
+                payloads = render.build_payloads(template, contexts)
+                if payloads is not None:
+                    reports = render.render_parallel(template, render_type, payloads, name, min(workers, size))
+            if reports is None:
+                reports = [render.render(template, render_type, context, jinja_env, name) for context in contexts]
+        if report_type == "pdf" and render_type == "xlsx" and wkhtmltopdf:
+            from . import html_pdf
+            with timing.stage("convert"):
+                reports = [html_pdf.xlsx_to_pdf(reports, wkhtmltopdf)]
+        elif report_type == "pdf":
+            converter = create_converter(**converter_options)
+            try:
+                with timing.stage("convert"):
+                    reports = list(convert_reports(converter, reports))
+            finally:
+                converter.stop()
+        merge, merge_pdf = pdf_merger() if report_type == "pdf" else ("zip", None)
+        if len(reports) == 1:
+            merge = "none"
+        with timing.stage("merge"):
+            report_file = merge_reports(reports, name, merge_pdf)
+        with timing.stage("attachment"):
+            checksum = file_checksum(report_file)
+            copy_to_path(report_file, os.path.join(filestore, checksum[:2], checksum))
+            report_file.seek(0, os.SEEK_END)
+            bytes_out = report_file.tell()
+    total = timings.total
+    return {
+        "template": template_name,
+        "report_type": report_type,
+        "records": size,
+        "workers": workers,
+        "sheets": sheets and report_type == "xlsx",
+        "merge": merge,
+        "stages": {stage: round(duration, 4) for stage, duration in timings.durations.items()},
+        "total": round(total, 4),
+        "documents_per_second": round(size / total, 2) if total else None,
+        "bytes_out": bytes_out,
+        "peak_rss_kb": peak_rss(),
+    }
+
+
+def _run_case_in_process(connection, args):
+    try:
+        result = run_case(*args)
+    except ConversionError as e:
+        result = {"template": args[0], "report_type": args[1], "records": args[2], "error": str(e)}
+    connection.send(result)
+    connection.close()
+
+
+def run_case_in_process(*args) -> dict:
+    """Runs case in a forked process which may start its own render processes."""
+    context = multiprocessing.get_context("fork")
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=_run_case_in_process, args=(sender, args))
+    process.start()
+    sender.close()
+    try:
+        return receiver.recv()
+    except EOFError:
+        return {"template": args[0], "report_type": args[1], "records": args[2],
+                "error": f"benchmark process exited with code {process.join() or process.exitcode}"}
+    finally:
+        process.join()
+
+
+def cases(templates, report_types, sizes):
+    """Yields template, report type and size of each benchmarked case."""
+    for template_name in templates:
+        template_type = os.path.splitext(template_name)[1][1:]
+        for report_type in report_types:
+            if report_type in ("docx", "txt") and template_type != "docx":
+                continue
+            if report_type == "xlsx" and template_type != "xlsx":
+                continue
+            for size in sizes:
+                yield template_name, report_type, size
+
+
+def converter_options(backend, executable) -> dict:
+    """Returns options of pdf converter, stub converter stands in when LibreOffice isn't installed."""
+    if backend == "auto":
+        backend = "pool" if shutil.which(executable) else "stub"
+    return {"backend": backend, "executable": executable}
+
+
+def _commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=TEMPLATES_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def _case_key(result) -> tuple:
+    return result["template"], result["report_type"], result["records"]
+
+
+def compare(results, baseline) -> list:
+    """Returns lines with ratio of total time and memory of results to baseline results."""
+    baseline_results = {_case_key(result): result for result in baseline["results"] if "error" not in result}
+    lines = []
+    for result in results:
+        previous = baseline_results.get(_case_key(result))
+        if not previous or "error" in result:
+            continue
+        lines.append(
+            "%-22s %-5s %6d  time x%.2f  rss x%.2f" % (
+                *_case_key(result),
+                result["total"] / previous["total"] if previous["total"] else 0,
+                result["peak_rss_kb"] / previous["peak_rss_kb"] if previous["peak_rss_kb"] else 0,
+            )
+        )
+    return lines
+
+
+def _import_in_process(modules) -> dict:
+    output = subprocess.run(
+        [sys.executable, "-c", STARTUP_SCRIPT, json.dumps(modules), json.dumps(ENGINE_LIBRARIES)],
+        cwd=os.path.dirname(TEMPLATES_DIR), capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(output)
+
+
+def startup(repeat=5) -> dict:
+    """Returns median import time and memory of model imports with lazy and eager engine libraries."""
+    result = {}
+    for mode, modules in (("lazy", MODEL_IMPORTS), ("eager", MODEL_IMPORTS + ENGINE_LIBRARIES)):
+        runs = sorted((_import_in_process(modules) for _ in range(repeat)), key=lambda run: run["import_time"])
+        median = runs[len(runs) // 2]
+        result[mode] = {
+            "import_time": round(median["import_time"], 4),
+            "rss_kb": median["rss_kb"],
+            "engine_libraries_loaded": median["engine_libraries_loaded"],
+        }
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--templates", default=",".join(TEMPLATES))
+    parser.add_argument("--types", default=",".join(REPORT_TYPES))
+    parser.add_argument("--sizes", default=",".join(map(str, SIZES)))
+    parser.add_argument("--workers", type=int, default=1, help="Processes rendering records, 1 renders sequentially.")
+    parser.add_argument("--converter", default="auto", choices=["auto", "pool", "subprocess", "stub"])
+    parser.add_argument("--libreoffice", default="libreoffice", help="LibreOffice executable.")
+    parser.add_argument("--wkhtmltopdf", help="wkhtmltopdf executable, xlsx reports are printed by it when given.")
+    parser.add_argument("--sheets", action="store_true", help="Render xlsx reports into sheets of one workbook.")
+    parser.add_argument("--output", help="File for JSON results, printed when omitted.")
+    parser.add_argument("--compare", help="JSON results of another run to compare with.")
+    parser.add_argument("--startup", action="store_true", help="Measure imports at registry load instead.")
+    args = parser.parse_args(argv)
+
+    if args.startup:
+        print(json.dumps({"commit": _commit(), "startup": startup()}, indent=2))
+        return
+
+    options = converter_options(args.converter, args.libreoffice)
+    filestore = tempfile.mkdtemp(prefix="report-benchmark-filestore-")
+    results = []
+    try:
+        for template_name, report_type, size in cases(
+            args.templates.split(","), args.types.split(","), [int(size) for size in args.sizes.split(",")],
+        ):
+            result = run_case_in_process(
+                template_name, report_type, size, options, args.workers, filestore, args.wkhtmltopdf, args.sheets,
+            )
+            results.append(result)
+            print("%-22s %-5s %6d  %s" % (
+                template_name, report_type, size,
+                result.get("error") or "%.3fs  %.1f docs/s  %d KB" % (
+                    result["total"], result["documents_per_second"], result["peak_rss_kb"],
+                ),
+            ), flush=True)
+    finally:
+        shutil.rmtree(filestore, ignore_errors=True)
+
+    output = {
+        "commit": _commit(),
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "cpu_count": os.cpu_count(),
+        "converter": options["backend"],
+        "wkhtmltopdf": bool(args.wkhtmltopdf),
+        "workers": args.workers,
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(output, f, indent=2)
+    else:
+        print(json.dumps(output, indent=2))
+    if args.compare:
+        with open(args.compare) as f:
+            print("\n".join(compare(results, json.load(f))))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,535 @@
+"""
+Conversion of rendered docx/xlsx files to pdf.
+
+Converters are per process: with prefork workers the server runs a pool in every worker,
+i.e. workers times pool size LibreOffice instances. Profiles are created in private
+temporary directories named after the process and removed when converters stop, converters
+of a process are stopped when it exits. LibreOffice runs in its own process group, which is
+killed with its helper processes. Instances and profiles of processes which were killed
+before they could stop their converters are removed when a new pool is created.
+
+Backends:
+ - pool: configurable number of warm headless LibreOffice instances reached over UNO,
+   each with its own user profile. Jobs wait in a queue for a free instance, have a
+   timeout and instances are recycled after a number of jobs or on a crash.
+   When the ``uno`` module isn't importable the pool runs one ``soffice`` process per job
+   with a private profile per slot.
+ - subprocess: one ``soffice --convert-to`` process per call, calls of a process share
+   one private profile and run one at a time.
+ - stub: writes a one page pdf without LibreOffice, used for tests and benchmarks.
+"""
+import atexit
+import logging
+import os
+import queue
+import re
+import shutil
+import signal
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+from abc import ABC, abstractmethod
+from io import BytesIO
+
+from .files import CHUNK_SIZE, private_dir
+
+_logger = logging.getLogger(__name__)
+
+PDF_EXPORT_FILTER = "pdf:draw_pdf_Export:{\"MaxImageResolution\":{\"type\":\"long\",\"value\":\"1200\"}}"
+MAX_IMAGE_RESOLUTION = 1200
+# Profile directories of converters, named after the process which created them.
+PROFILE_DIR_RE = re.compile(r"^report-lo-(?:pool-)?(\d+)-")
+
+_lock = threading.Lock()
+_converter = None
+_converter_key = None
+
+
+class ConversionError(Exception):
+    """Raised when a file can't be converted to pdf."""
+
+
+def pdf_path(path, outdir) -> str:
+    """Returns path of pdf which LibreOffice creates for path in outdir."""
+    return os.path.join(outdir, f"{os.path.splitext(os.path.basename(path))[0]}.pdf")
+
+
+def profile_url(profile_dir) -> str:
+    """Returns LibreOffice user installation argument for profile directory."""
+    return f"-env:UserInstallation=file://{os.path.abspath(profile_dir).replace(os.sep, '/')}"
+
+
+def start_process(args, **kwargs) -> subprocess.Popen:
+    """Starts LibreOffice in a new process group, so its helper processes can be killed with it."""
+    return subprocess.Popen(args, start_new_session=os.name == "posix", **kwargs)
+
+
+def kill_process(process):
+    """Kills process started by start_process with its process group."""
+    if os.name == "posix":
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+    else:
+        process.kill()
+
+
+def _pid_alive(pid) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _kill_profile_processes(profile_dir):
+    """Kills processes whose command line refers to profile directory, Linux only."""
+    if not os.path.isdir("/proc"):
+        return
+    marker = os.path.abspath(profile_dir).encode()
+    for name in os.listdir("/proc"):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f"/proc/{name}/cmdline", "rb") as f:
+                cmdline = f.read()
+        except OSError:
+            continue
+        if marker in cmdline:
+            try:
+                os.kill(int(name), signal.SIGKILL)
+            except (ProcessLookupError, PermissionError):
+                pass
+
+
+def reap_orphans(root=None):
+    """Kills LibreOffice instances and removes profiles of converters of processes which are gone."""
+    root = root or tempfile.gettempdir()
+    try:
+        names = os.listdir(root)
+    except OSError:
+        return
+    for name in names:
+        match = PROFILE_DIR_RE.match(name)
+        if not match or _pid_alive(int(match.group(1))):
+            continue
+        path = os.path.join(root, name)
+        _logger.info("Removing LibreOffice profile %s of a stopped process.", path)
+        _kill_profile_processes(path)
+        remove_profile(path)
+
+
+class Converter(ABC):
+    """Base converter. Converters are also pool workers."""
+
+    jobs = 0
+
+    def start(self):
+        """Prepares converter for jobs."""
+
+    def stop(self):
+        """Releases resources of converter."""
+
+    def kill(self):
+        """Aborts running job, converter is stopped afterwards."""
+        self.stop()
+
+    def alive(self) -> bool:
+        """Returns whether converter can take jobs."""
+        return True
+
+    @abstractmethod
+    def convert(self, paths, outdir, timeout=None) -> list:
+        """
+        Converts files to pdf into outdir and returns paths of pdf files in the same order.
+        Timeout is given in seconds per file.
+        """
+
+
+def remove_profile(profile_dir):
+    """Removes LibreOffice profile directory."""
+    if profile_dir:
+        shutil.rmtree(profile_dir, ignore_errors=True)
+
+
+class SubprocessConverter(Converter):
+    """
+    Runs one LibreOffice process per call. Without profile_dir calls use a private profile
+    of the converter and run one at a time, LibreOffice doesn't share a profile between processes.
+    """
+
+    def __init__(self, executable, profile_dir=None, timeout=60):
+        self.executable = executable
+        self.profile_dir = profile_dir
+        self.timeout = timeout
+        self.process = None
+        self._own_profile = profile_dir is None
+        self._lock = threading.Lock()
+
+    def stop(self):
+        if self.process and self.process.poll() is None:
+            kill_process(self.process)
+        remove_profile(self.profile_dir)
+        if self._own_profile:
+            self.profile_dir = None
+
+    def convert(self, paths, outdir, timeout=None) -> list:
+        with self._lock:
+            if self.profile_dir is None:
+                self.profile_dir = tempfile.mkdtemp(prefix=f"report-lo-{os.getpid()}-")
+            return self._convert(paths, outdir, timeout)
+
+    def _convert(self, paths, outdir, timeout=None) -> list:
+        args = [
+            self.executable, "--headless", "--norestore", profile_url(self.profile_dir),
+            "--convert-to", PDF_EXPORT_FILTER, "--outdir", outdir, *paths,
+        ]
+        timeout = (timeout or self.timeout) * len(paths)
+        process = self.process = start_process(args, stderr=subprocess.PIPE, stdout=subprocess.PIPE)
+        try:
+            stdout, stderr = process.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            kill_process(process)
+            process.communicate()
+            raise ConversionError(f"LibreOffice didn't convert {len(paths)} file(s) in {timeout}s.")
+        finally:
+            self.process = None
+        results = [pdf_path(path, outdir) for path in paths]
+        missing = [path for path in results if not os.path.exists(path)]
+        if missing:
+            raise ConversionError(f"LibreOffice didn't create {', '.join(missing)}: {stderr.decode(errors='replace')}")
+        return results
+
+
+class UnoConverter(Converter):
+    """Headless LibreOffice instance with a private profile reached over a UNO socket."""
+
+    def __init__(self, executable, profile_dir, start_timeout=30):
+        self.executable = executable
+        self.profile_dir = profile_dir
+        self.start_timeout = start_timeout
+        self.process = None
+        self.desktop = None
+
+    @staticmethod
+    def _free_port() -> int:
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            return sock.getsockname()[1]
+
+    @staticmethod
+    def _properties(**values) -> tuple:
+        from com.sun.star.beans import PropertyValue
+        properties = []
+        for name, value in values.items():
+            prop = PropertyValue()
+            prop.Name = name
+            prop.Value = value
+            properties.append(prop)
+        return tuple(properties)
+
+    def start(self):
+        import uno
+        port = self._free_port()
+        connection = f"socket,host=127.0.0.1,port={port};urp;StarOffice.ComponentContext"
+        self.process = start_process(
+            [
+                self.executable, "--headless", "--invisible", "--nologo", "--nodefault", "--norestore",
+                f"--accept={connection}", profile_url(self.profile_dir),
+            ],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        local_context = uno.getComponentContext()
+        resolver = local_context.ServiceManager.createInstanceWithContext(
+            "com.sun.star.bridge.UnoUrlResolver", local_context
+        )
+        deadline = time.monotonic() + self.start_timeout
+        while True:
+            try:
+                context = resolver.resolve(f"uno:{connection}")
+                break
+            except Exception:
+                if self.process.poll() is not None or time.monotonic() > deadline:
+                    self.stop()
+                    raise ConversionError("LibreOffice didn't start.")
+                time.sleep(0.25)
+        self.desktop = context.ServiceManager.createInstanceWithContext("com.sun.star.frame.Desktop", context)
+        self.jobs = 0
+
+    def stop(self):
+        if self.desktop is not None:
+            try:
+                self.desktop.terminate()
+            except Exception:
+                pass
+            self.desktop = None
+        if self.process is not None:
+            try:
+                self.process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                pass
+            # Helper processes of the instance are in its group.
+            kill_process(self.process)
+            self.process.wait()
+            self.process = None
+        remove_profile(self.profile_dir)
+
+    def kill(self):
+        if self.process is not None:
+            kill_process(self.process)
+
+    def alive(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+
+    def convert(self, paths, outdir, timeout=None) -> list:
+        import uno
+        results = []
+        for path in paths:
+            document = self.desktop.loadComponentFromURL(
+                uno.systemPathToFileUrl(os.path.abspath(path)), "_blank", 0,
+                self._properties(Hidden=True, ReadOnly=True),
+            )
+            if document is None:
+                raise ConversionError(f"LibreOffice can't open {path}.")
+            try:
+                if document.supportsService("com.sun.star.sheet.SpreadsheetDocument"):
+                    filter_name = "calc_pdf_Export"
+                else:
+                    filter_name = "writer_pdf_Export"
+                filter_data = uno.Any(
+                    "[]com.sun.star.beans.PropertyValue",
+                    self._properties(MaxImageResolution=MAX_IMAGE_RESOLUTION),
+                )
+                result = pdf_path(path, outdir)
+                document.storeToURL(
+                    uno.systemPathToFileUrl(os.path.abspath(result)),
+                    self._properties(FilterName=filter_name, FilterData=filter_data),
+                )
+            finally:
+                document.close(True)
+            results.append(result)
+        return results
+
+
+class StubConverter(Converter):
+    """Writes a one page pdf with the source file name, stands in for LibreOffice."""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+
+    def convert(self, paths, outdir, timeout=None) -> list:
+        results = []
+        for path in paths:
+            if self.delay:
+                time.sleep(self.delay)
+            result = pdf_path(path, outdir)
+            with open(result, "wb") as f:
+                f.write(stub_pdf(os.path.basename(path)))
+            results.append(result)
+        return results
+
+
+def stub_pdf(text) -> bytes:
+    """Returns minimal valid one page pdf showing text."""
+    text = text.encode("latin-1", "replace").replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)")
+    stream = b"BT /F1 12 Tf 72 720 Td (" + text + b") Tj ET"
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Contents 4 0 R "
+        b"/Resources << /Font << /F1 5 0 R >> >> >>",
+        b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    pdf = b"%PDF-1.4\n"
+    offsets = []
+    for number, obj in enumerate(objects, 1):
+        offsets.append(len(pdf))
+        pdf += b"%d 0 obj\n%s\nendobj\n" % (number, obj)
+    xref = len(pdf)
+    pdf += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    pdf += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    pdf += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return pdf
+
+
+class _Slot:
+    """Place in pool which holds a worker between jobs."""
+
+    def __init__(self, index):
+        self.index = index
+        self.worker = None
+
+
+class ConverterPool(Converter):
+    """
+    Queue of converters created by factory. Each job takes a free slot, converts with its worker
+    and gives the slot back. Workers are started lazily, recycled after max_jobs jobs, on a crash
+    or when a job exceeds timeout. If a worker can't start or crashes, the job is passed to fallback.
+    Directory profiles_dir of worker profiles is removed when the pool stops.
+    """
+
+    def __init__(self, factory, size=2, max_jobs=200, timeout=60, queue_timeout=120, fallback=None,
+                 profiles_dir=None):
+        self.factory = factory
+        self.size = size
+        self.max_jobs = max_jobs
+        self.timeout = timeout
+        self.queue_timeout = queue_timeout
+        self.fallback = fallback
+        self.profiles_dir = profiles_dir
+        self._slots = queue.Queue()
+        for index in range(size):
+            self._slots.put(_Slot(index))
+
+    def convert(self, paths, outdir, timeout=None) -> list:
+        try:
+            slot = self._slots.get(timeout=self.queue_timeout)
+        except queue.Empty:
+            raise ConversionError(f"No free converter in {self.queue_timeout}s.")
+        try:
+            return self._convert(slot, paths, outdir, timeout or self.timeout)
+        finally:
+            self._slots.put(slot)
+
+    def _convert(self, slot, paths, outdir, timeout) -> list:
+        try:
+            if slot.worker is None or not slot.worker.alive():
+                self._recycle(slot)
+                slot.worker = self.factory(slot.index)
+                slot.worker.start()
+        except Exception:
+            self._recycle(slot)
+            if self.fallback is None:
+                raise
+            _logger.warning("Converter %s didn't start, using fallback.", slot.index, exc_info=True)
+            return self.fallback.convert(paths, outdir, timeout)
+        timed_out = threading.Event()
+
+        def kill():
+            timed_out.set()
+            slot.worker.kill()
+
+        timer = threading.Timer(timeout * len(paths), kill)
+        timer.start()
+        try:
+            results = slot.worker.convert(paths, outdir, timeout)
+        except Exception:
+            timer.cancel()
+            self._recycle(slot)
+            if timed_out.is_set():
+                raise ConversionError(f"Conversion of {len(paths)} file(s) exceeded {timeout * len(paths)}s.")
+            if self.fallback is None:
+                raise
+            _logger.warning("Converter %s crashed, using fallback.", slot.index, exc_info=True)
+            return self.fallback.convert(paths, outdir, timeout)
+        timer.cancel()
+        slot.worker.jobs += 1
+        if slot.worker.jobs >= self.max_jobs:
+            self._recycle(slot)
+        return results
+
+    @staticmethod
+    def _recycle(slot):
+        if slot.worker is not None:
+            try:
+                slot.worker.stop()
+            except Exception:
+                _logger.warning("Converter %s didn't stop.", slot.index, exc_info=True)
+            slot.worker = None
+
+    def stop(self):
+        for _index in range(self.size):
+            self._recycle(self._slots.get())
+        for index in range(self.size):
+            self._slots.put(_Slot(index))
+        if self.fallback is not None:
+            self.fallback.stop()
+        remove_profile(self.profiles_dir)
+
+
+def _uno_available() -> bool:
+    try:
+        import uno  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def create_converter(backend, executable, workers=2, max_jobs=200, timeout=60, queue_timeout=120) -> Converter:
+    """Returns new converter for backend."""
+    if backend == "stub":
+        return StubConverter()
+    if backend == "subprocess":
+        return SubprocessConverter(executable, timeout=timeout)
+    reap_orphans()
+    profiles_dir = tempfile.mkdtemp(prefix=f"report-lo-pool-{os.getpid()}-")
+    if _uno_available():
+        def factory(index):
+            return UnoConverter(executable, os.path.join(profiles_dir, str(index)))
+    else:
+        _logger.info("Python UNO bridge isn't available, converter pool uses LibreOffice processes.")
+
+        def factory(index):
+            return SubprocessConverter(executable, os.path.join(profiles_dir, str(index)), timeout)
+    return ConverterPool(
+        factory,
+        size=workers,
+        max_jobs=max_jobs,
+        timeout=timeout,
+        queue_timeout=queue_timeout,
+        fallback=SubprocessConverter(executable, timeout=timeout),
+        profiles_dir=profiles_dir,
+    )
+
+
+def get_converter(backend, executable, **options) -> Converter:
+    """Returns converter shared by threads of current process, recreates it when options change."""
+    global _converter, _converter_key
+    key = (os.getpid(), backend, executable, tuple(sorted(options.items())))
+    with _lock:
+        if _converter_key != key:
+            if _converter is not None and _converter_key[0] == os.getpid():
+                _converter.stop()
+            _converter = create_converter(backend, executable, **options)
+            _converter_key = key
+        return _converter
+
+
+def convert_reports(converter, reports):
+    """
+    Yields pdf reports of docx or xlsx reports converted with one converter call in a private
+    temporary directory. Reports are written to disk as they are taken, pdf reports are read
+    back one by one.
+    """
+    with private_dir() as outdir:
+        paths = []
+        names = []
+        for index, report in enumerate(reports):
+            path = os.path.join(outdir, f"{index}{os.path.splitext(report.name)[1]}")
+            with open(path, "wb") as f:
+                report.seek(0)
+                shutil.copyfileobj(report, f, CHUNK_SIZE)
+            paths.append(path)
+            names.append(f"{os.path.splitext(report.name)[0]}.pdf")
+        for name, path in zip(names, converter.convert(paths, outdir)):
+            with open(path, "rb") as f:
+                pdf_report = BytesIO(f.read())
+            os.remove(path)
+            pdf_report.name = name
+            yield pdf_report
+
+
+@atexit.register
+def stop_converter():
+    """Stops converter of current process, converters inherited from parent process are left to it."""
+    global _converter, _converter_key
+    with _lock:
+        if _converter is not None and _converter_key[0] == os.getpid():
+            _converter.stop()
+        _converter = _converter_key = None
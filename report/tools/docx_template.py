@@ -0,0 +1,73 @@
+"""
+Docx templates: jinja ready xml of document parts and plain text skeleton for txt reports.
+"""
+import re
+from io import BytesIO
+
+import docx
+from docx.oxml.ns import qn
+from docxtpl import DocxTemplate
+
+# Tags which replace the whole paragraph, table row or cell like in docxtpl, e.g. {%p for line in lines %}.
+BLOCK_TAG_RE = {
+    kind: re.compile(r"(\{%%|\{\{|\{#)%s ([^}%%#]*(?:%%\}|\}\}|#\}))" % kind)
+    for kind in ("p", "tr", "tc")
+}
+RUN_TAG_RE = re.compile(r"(\{%|\{\{)r ")
+TAG_RE = re.compile(r"(?<=\{[{%])(.*?)(?=[}%]\})")
+# Word replaces quotes typed in tags by typographic ones.
+TAG_QUOTES = str.maketrans({"“": '"', "”": '"', "‘": "'", "’": "'"})
+
+
+class CachedDocxTemplate(DocxTemplate):
+    """Docx template which keeps jinja ready xml of parts in the cached template."""
+
+    def __init__(self, template):
+        super().__init__(BytesIO(template.data))
+        self.patched_xml = template.patched_xml
+
+    def patch_xml(self, src_xml):
+        patched_xml = self.patched_xml.get(src_xml)
+        if patched_xml is None:
+            patched_xml = self.patched_xml[src_xml] = super().patch_xml(src_xml)
+        return patched_xml
+
+
+def _block_source(text, kind, end="\n") -> str:
+    text = TAG_RE.sub(lambda match: match.group(0).translate(TAG_QUOTES), text)
+    match = BLOCK_TAG_RE[kind].search(text)
+    if match:
+        return f"{match.group(1)} {match.group(2)}"
+    return RUN_TAG_RE.sub(r"\1 ", text) + end
+
+
+def _table_source(tbl) -> str:
+    rows = []
+    for tr in tbl.tr_lst:
+        cells = [
+            " ".join(_block_source(p.text, "p", "") for p in tc.iterchildren(qn("w:p")))
+            for tc in tr.tc_lst
+        ]
+        row = "\t".join(cells)
+        match = BLOCK_TAG_RE["tr"].search(row)
+        if match:
+            rows.append(f"{match.group(1)} {match.group(2)}")
+            continue
+        rows.append("\t".join(_block_source(cell, "tc", "") for cell in cells) + "\n")
+    return "".join(rows)
+
+
+def txt_source(data) -> str:
+    """
+    Returns jinja source of text of docx body: a line for each paragraph and a line with
+    tab separated cells for each table row. Paragraphs, rows and cells with p, tr and tc
+    tags are replaced by their tags like in docxtpl.
+    """
+    body = docx.Document(BytesIO(data)).element.body
+    parts = []
+    for element in body.iterchildren():
+        if element.tag == qn("w:p"):
+            parts.append(_block_source(element.text, "p"))
+        elif element.tag == qn("w:tbl"):
+            parts.append(_table_source(element))
+    return "".join(parts)
@@ -0,0 +1,151 @@
+"""
+Report files which don't have to fit in memory.
+"""
+import hashlib
+import itertools
+import os
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+from io import BytesIO
+from zipfile import ZipFile, ZipInfo, ZIP_DEFLATED, ZIP_STORED
+
+# Files bigger than this are moved from memory to disk.
+SPOOL_MAX_SIZE = 8 * 1024 * 1024
+CHUNK_SIZE = 1024 * 1024
+COMPRESSED_EXTENSIONS = (".docx", ".xlsx", ".pdf", ".zip")
+# Memory backed directories used for temporary files while they have enough free space.
+TMPFS_DIRS = ("/dev/shm",)
+TMPFS_MIN_FREE = 256 * 1024 * 1024
+MIMETYPES = {
+    ".docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    ".xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    ".pdf": "application/pdf",
+    ".txt": "text/plain",
+    ".zip": "application/zip",
+}
+
+
+class SpooledReport(tempfile.SpooledTemporaryFile):
+    """Temporary report file kept in memory until it grows over max_size."""
+
+    def __init__(self, name, max_size=SPOOL_MAX_SIZE):
+        super().__init__(max_size=max_size)
+        self.report_name = name
+
+    @property
+    def name(self) -> str:
+        return self.report_name
+
+    def getvalue(self) -> bytes:
+        self.seek(0)
+        return self.read()
+
+
+def file_size(fileobj) -> int:
+    """Returns size of file object."""
+    fileobj.seek(0, os.SEEK_END)
+    return fileobj.tell()
+
+
+def file_mimetype(name) -> str:
+    """Returns mimetype of report file by its extension."""
+    return MIMETYPES.get(os.path.splitext(name)[1], "application/octet-stream")
+
+
+def file_checksum(fileobj) -> str:
+    """Returns sha1 of content of file object read by chunks."""
+    checksum = hashlib.sha1()
+    fileobj.seek(0)
+    for chunk in iter(lambda: fileobj.read(CHUNK_SIZE), b""):
+        checksum.update(chunk)
+    return checksum.hexdigest()
+
+
+def copy_to_path(fileobj, path):
+    """Writes content of file object to content addressed path, existing path is kept."""
+    if os.path.exists(path):
+        return
+    write_to_path(fileobj, path)
+
+
+def write_to_path(fileobj, path):
+    """Writes content of file object to path atomically, existing file is replaced."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, "wb") as f:
+            fileobj.seek(0)
+            shutil.copyfileobj(fileobj, f, CHUNK_SIZE)
+        os.replace(tmp_path, path)
+    except Exception:
+        os.remove(tmp_path)
+        raise
+
+
+def write_zip_archive(name, members) -> SpooledReport:
+    """Writes pairs of name and file object to zip archive, already compressed files are stored as is."""
+    zip_archive = SpooledReport(name)
+    with ZipFile(zip_archive, "w", ZIP_DEFLATED, False) as zip_file:
+        for member_name, member_file in members:
+            member = ZipInfo(member_name, time.localtime()[:6])
+            member.compress_type = ZIP_STORED if member_name.endswith(COMPRESSED_EXTENSIONS) else ZIP_DEFLATED
+            with zip_file.open(member, "w") as f:
+                shutil.copyfileobj(member_file, f, CHUNK_SIZE)
+    return zip_archive
+
+
+def zip_reports(reports, name, start=1) -> SpooledReport:
+    """Returns zip archive of reports numbered from start, every report is added as soon as it's taken."""
+    def members():
+        for index, report in enumerate(reports, start):
+            report.seek(0)
+            yield report.name.replace(".", f" ({index})."), report
+
+    return write_zip_archive(f"{name}.zip", members())
+
+
+def merge_pdf_reports(reports, name, merge_pdf) -> BytesIO:
+    """Returns one pdf with pages of all reports, merge_pdf merges contents of pdf files."""
+    pdf_report = BytesIO(merge_pdf([report.getvalue() for report in reports]))
+    pdf_report.name = f"{name}.pdf"
+    return pdf_report
+
+
+def merge_reports(reports, name, merge_pdf=None):
+    """
+    Returns the only report, one pdf of all reports when merge_pdf is given or a zip archive
+    of reports.
+    """
+    reports = iter(reports)
+    first_report = next(reports)
+    second_report = next(reports, None)
+    if second_report is None:
+        return first_report
+    reports = itertools.chain([first_report, second_report], reports)
+    if merge_pdf is not None:
+        return merge_pdf_reports(reports, name, merge_pdf)
+    return zip_reports(reports, name)
+
+
+def temp_root() -> str:
+    """Returns directory for temporary files, memory backed one when available."""
+    for path in TMPFS_DIRS:
+        try:
+            stat = os.statvfs(path)
+        except OSError:
+            continue
+        if os.access(path, os.W_OK | os.X_OK) and stat.f_bavail * stat.f_frsize >= TMPFS_MIN_FREE:
+            return path
+    return tempfile.gettempdir()
+
+
+@contextmanager
+def private_dir(prefix="report-"):
+    """Yields new directory accessible only by current user, removed with its content on exit."""
+    path = tempfile.mkdtemp(prefix=prefix, dir=temp_root())
+    try:
+        yield path
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
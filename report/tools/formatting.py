@@ -0,0 +1,20 @@
+"""
+Formatting helpers available in templates and on report.report.
+"""
+
+
+def formatting_float(number: float) -> str:
+    """Returns number with comma."""
+    if number is False:
+        return "0,00"
+    return "{:.2f}".format(round(number, 2)).replace(".", ",")
+
+
+def price2words(price: float) -> str:
+    """Returns price in rubles and kopecks as words."""
+    if price is False:
+        return ""
+    from num2words import num2words
+    rubles = num2words(int(price), lang="ru")
+    kopecks = num2words(round((price - int(price)) * 100), lang="ru")
+    return f"{rubles} руб. {kopecks} коп."
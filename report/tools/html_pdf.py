@@ -0,0 +1,85 @@
+"""
+Pdf of rendered workbooks without LibreOffice.
+
+Sheets are converted to html in process by xlsx2html and the html is printed by wkhtmltopdf,
+the binary Odoo uses for its own reports. Sheets of many reports are joined into one html
+document with page breaks, so one wkhtmltopdf process prints all of them.
+"""
+import re
+from io import BytesIO
+from xml.etree import ElementTree
+from zipfile import ZipFile
+
+import pdfkit
+from xlsx2html import xlsx2html
+
+from .converter import ConversionError
+
+BODY_RE = re.compile(r"<body[^>]*>(.*)</body>", re.DOTALL)
+SHEET_TAG = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}sheet"
+PAGE_BREAK = '<div style="page-break-after: always;"></div>'
+HTML_DOCUMENT = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="UTF-8">
+<style>table {{ page-break-inside: auto; }} tr {{ page-break-inside: avoid; }}</style>
+</head>
+<body>
+{body}
+</body>
+</html>
+"""
+PDF_OPTIONS = {
+    "encoding": "UTF-8",
+    "page-size": "A4",
+    "margin-top": "5mm",
+    "margin-bottom": "5mm",
+    "margin-left": "5mm",
+    "margin-right": "5mm",
+    "quiet": "",
+}
+
+
+def sheet_names(report) -> list:
+    """Returns names of sheets of workbook in their order."""
+    report.seek(0)
+    with ZipFile(report) as package:
+        workbook = ElementTree.fromstring(package.read("xl/workbook.xml"))
+    return [sheet.get("name") for sheet in workbook.iter(SHEET_TAG)]
+
+
+def xlsx_to_html(report) -> list:
+    """Returns html body of every sheet of workbook."""
+    bodies = []
+    for name in sheet_names(report):
+        report.seek(0)
+        html = xlsx2html(report, sheet=name).getvalue()
+        match = BODY_RE.search(html)
+        bodies.append(match.group(1) if match else html)
+    return bodies
+
+
+def html_document(bodies) -> str:
+    """Returns html document with bodies on separate pages."""
+    return HTML_DOCUMENT.format(body=PAGE_BREAK.join(bodies))
+
+
+def html_to_pdf(html, executable, options=None) -> bytes:
+    """Returns pdf printed from html by wkhtmltopdf."""
+    try:
+        return pdfkit.from_string(
+            html,
+            False,
+            options=dict(PDF_OPTIONS, **(options or {})),
+            configuration=pdfkit.configuration(wkhtmltopdf=executable),
+        )
+    except OSError as e:
+        raise ConversionError(str(e)) from e
+
+
+def xlsx_to_pdf(reports, executable, options=None) -> BytesIO:
+    """Returns one pdf with sheets of all xlsx reports."""
+    bodies = []
+    for report in reports:
+        bodies.extend(xlsx_to_html(report))
+    return BytesIO(html_to_pdf(html_document(bodies), executable, options))
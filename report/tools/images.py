@@ -0,0 +1,70 @@
+"""
+Images prepared for templates.
+
+Processed images are cached by checksum of the source image and parameters of the transformation,
+so a logo shared by all records of a batch is decoded, padded and encoded once per worker.
+Sources are cut down to the smallest image variant of image.mixin which covers the size of
+pictures in the template, records give the stored variant instead of image_1920.
+"""
+import hashlib
+from base64 import decodebytes
+from io import BytesIO
+
+from .lru import LRUCache
+
+IMAGE_VARIANTS = (128, 256, 512, 1024, 1920)
+IMAGE_FIELDS = tuple(f"image_{variant}" for variant in IMAGE_VARIANTS)
+
+images = LRUCache(max_entries=256, max_size=32 * 1024 * 1024)
+
+
+def variant_size(size=0) -> int:
+    """Returns side of smallest image variant which covers size pixels, 1920 when size is unknown."""
+    for variant in IMAGE_VARIANTS:
+        if size and variant >= size:
+            return variant
+    return IMAGE_VARIANTS[-1]
+
+
+def variant_field(size=0) -> str:
+    """Returns name of image field of smallest variant which covers size pixels."""
+    return f"image_{variant_size(size)}"
+
+
+def variant_value(value, size=0):
+    """Returns base64 image of value, which is base64 image or record of image.mixin."""
+    if not value or isinstance(value, (bytes, str)):
+        return value
+    return getattr(value, variant_field(size), None) or getattr(value, "image_1920", False)
+
+
+def square_png(value, size=0) -> bytes:
+    """Returns png of image on white square background."""
+    return _processed_png(value, ("square",), size, lambda width, height: (max(width, height),) * 2)
+
+
+def wide_png(value, width_factor, size=0) -> bytes:
+    """Returns png of image on the left of white background width_factor times wider than image."""
+    return _processed_png(
+        value, ("wide", width_factor), size, lambda width, height: (int(width * width_factor), height),
+    )
+
+
+def _processed_png(value, transform, size, background_size) -> bytes:
+    if isinstance(value, str):
+        value = value.encode()
+    max_side = variant_size(size)
+    key = (hashlib.sha1(value).hexdigest(), transform, max_side)
+    return images.get_or_create(key, lambda: _pad(value, max_side, background_size), len)
+
+
+def _pad(value, max_side, background_size) -> bytes:
+    from PIL import Image
+    image = Image.open(BytesIO(decodebytes(value)))
+    if max(image.size) > max_side:
+        image.thumbnail((max_side, max_side))
+    background_image = Image.new("RGB", background_size(*image.size), "white")
+    background_image.paste(image)
+    fp = BytesIO()
+    background_image.save(fp, "png")
+    return fp.getvalue()
@@ -0,0 +1,88 @@
+import os
+import threading
+import weakref
+from collections import OrderedDict
+
+_caches = weakref.WeakSet()
+
+
+def _reset_locks():
+    """Gives caches of a forked process new locks, locks held by other threads at fork are never released."""
+    for cache in list(_caches):
+        cache._lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_locks)
+
+
+class LRUCache:
+    """Thread safe least recently used cache bounded by number of entries and total size of values."""
+
+    def __init__(self, max_entries=128, max_size=None):
+        self.max_entries = max_entries
+        self.max_size = max_size
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        _caches.add(self)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key) -> bool:
+        return key in self._entries
+
+    def get(self, key, default=None):
+        """Returns value of key and marks it as recently used."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, size=0):
+        """Stores value of key and evicts least recently used values over limits."""
+        with self._lock:
+            if key in self._entries:
+                self.size -= self._entries.pop(key)[1]
+            if self.max_size is not None and size > self.max_size:
+                return value
+            self._entries[key] = (value, size)
+            self.size += size
+            while len(self._entries) > self.max_entries or (self.max_size is not None and self.size > self.max_size):
+                self.size -= self._entries.popitem(last=False)[1][1]
+            return value
+
+    def get_or_create(self, key, create, sizeof=None):
+        """Returns value of key, creates and stores it when missing."""
+        value = self.get(key, self)
+        if value is self:
+            value = create()
+            self.put(key, value, sizeof(value) if sizeof else 0)
+        return value
+
+    def discard(self, predicate):
+        """Removes values whose key matches predicate."""
+        with self._lock:
+            for key in [key for key in self._entries if predicate(key)]:
+                self.size -= self._entries.pop(key)[1]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def stats(self) -> dict:
+        """Returns hit and miss counters with current usage."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(self._entries),
+            "size": self.size,
+        }
@@ -0,0 +1,257 @@
+"""
+Rendering of report files from templates.
+
+Libraries of docx and xlsx engines are imported on first render of the type, so workers
+which never print a report don't load them. Every render has its own template writer
+which filters find in the jinja context, so documents can be rendered concurrently and
+in worker processes. Jinja environment is shared by all renders of a worker and keeps
+code compiled from template parts.
+"""
+import hashlib
+import multiprocessing
+import os
+import pickle
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+import jinja2
+
+from . import formatting
+from .barcodes import barcode_png
+from .images import square_png, variant_value
+from .lru import LRUCache
+from .snapshot import SnapshotError, build_payload
+from .template_cache import Template
+from .timing import stage
+
+DOCUMENT_KEY = "_report_document"
+IMAGE_SIZE_KEY = "_report_image_size"
+# Changes when options of environment change the code compiled from templates.
+COMPILE_VERSION = "1"
+SHEET_NAME_LENGTH = 31
+SHEET_NAME_INVALID_RE = re.compile(r"[\[\]:*?/\\]")
+
+_worker = {}
+_jinja_env = None
+_jinja_env_lock = threading.Lock()
+
+
+@jinja2.pass_context
+def replace_barcode(context, value, type, width, height, name, write_text=False):
+    """Replaces barcode in template by name."""
+    if DOCUMENT_KEY not in context:
+        return ""
+    context[DOCUMENT_KEY].replace_pic(name, BytesIO(barcode_png(type, value, width, height, write_text)))
+    return ""
+
+
+@jinja2.pass_context
+def replace_image(context, value, name):
+    """Replaces image in document, value is base64 image or record of image.mixin."""
+    if DOCUMENT_KEY not in context:
+        return ""
+    size = context.get(IMAGE_SIZE_KEY, 0)
+    context[DOCUMENT_KEY].replace_pic(name, BytesIO(square_png(variant_value(value, size), size)))
+    return ""
+
+
+@jinja2.pass_context
+def render_barcode(context, value, type, width, height, write_text=False):
+    """Generates barcode by data."""
+    if DOCUMENT_KEY not in context:
+        return ""
+    from docx.shared import Mm
+    from docxtpl import InlineImage
+    fp = BytesIO(barcode_png(type, value, width, height, write_text))
+    return InlineImage(context[DOCUMENT_KEY], fp, height=Mm(height))
+
+
+class ReportEnvironment(jinja2.Environment):
+    """
+    Jinja environment which keeps templates compiled from strings. docxtpl compiles xml of
+    document parts with from_string on every render, so the same source is compiled once
+    per worker, or loaded from bytecode cache filled by another worker or a previous run.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.compiled_templates = LRUCache(max_entries=256, max_size=64 * 1024 * 1024)
+
+    def from_string(self, source, globals=None, template_class=None):
+        if globals or template_class or not isinstance(source, str):
+            return super().from_string(source, globals, template_class)
+        key = hashlib.sha1(f"{COMPILE_VERSION}\0{source}".encode()).hexdigest()
+        return self.compiled_templates.get_or_create(
+            key,
+            lambda: self.template_class.from_code(self, self._load_code(key, source), self.make_globals(None)),
+            lambda template: len(source),
+        )
+
+    def _load_code(self, key, source):
+        """Returns code of source from bytecode cache, compiles and stores it on a miss."""
+        if self.bytecode_cache is None:
+            return self.compile(source)
+        bucket = self.bytecode_cache.get_bucket(self, key, None, source)
+        if bucket.code is None:
+            bucket.code = self.compile(source)
+            self.bytecode_cache.set_bucket(bucket)
+        return bucket.code
+
+
+def create_jinja_env(cache_dir=None) -> ReportEnvironment:
+    """Returns jinja environment with report filters and helpers, compiled code is stored in cache_dir."""
+    bytecode_cache = None
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+        bytecode_cache = jinja2.FileSystemBytecodeCache(cache_dir)
+    jinja_env = ReportEnvironment(bytecode_cache=bytecode_cache)
+    jinja_env.cache_dir = cache_dir
+    jinja_env.filters["render_barcode"] = render_barcode
+    jinja_env.filters["replace_barcode"] = replace_barcode
+    jinja_env.filters["replace_image"] = replace_image
+    for helper in (formatting.formatting_float, formatting.price2words):
+        jinja_env.filters[helper.__name__] = helper
+        jinja_env.globals[helper.__name__] = helper
+    return jinja_env
+
+
+def get_jinja_env(cache_dir=None) -> ReportEnvironment:
+    """Returns jinja environment shared by renders of current worker."""
+    global _jinja_env
+    with _jinja_env_lock:
+        if _jinja_env is None or _jinja_env.cache_dir != cache_dir:
+            _jinja_env = create_jinja_env(cache_dir)
+        return _jinja_env
+
+
+def render_docx(template, context, jinja_env, name) -> BytesIO:
+    """Creating docx report."""
+    writer = template.docx_template()
+    writer.render(dict(context, **{DOCUMENT_KEY: writer, IMAGE_SIZE_KEY: template.image_size()}), jinja_env)
+    docx_report = BytesIO()
+    with stage("save"):
+        writer.save(docx_report)
+    docx_report.name = f"{name}.docx"
+    return docx_report
+
+
+def unique_sheet_names(names) -> list:
+    """
+    Returns names valid for sheets of one workbook: characters forbidden by Excel are replaced,
+    names are cut to 31 characters and repeated names are numbered.
+    """
+    result = []
+    taken = set()
+    for index, name in enumerate(names, 1):
+        name = SHEET_NAME_INVALID_RE.sub(" ", str(name or "")).strip().strip("'") or f"Sheet{index}"
+        sheet_name = name[:SHEET_NAME_LENGTH]
+        number = 1
+        while sheet_name.lower() in taken:
+            number += 1
+            suffix = f" ({number})"
+            sheet_name = name[:SHEET_NAME_LENGTH - len(suffix)] + suffix
+        taken.add(sheet_name.lower())
+        result.append(sheet_name)
+    return result
+
+
+def render_xlsx(template, context, name) -> BytesIO:
+    """Creating xlsx report."""
+    return render_xlsx_book(template, [context], [name], name)
+
+
+def render_xlsx_book(template, contexts, sheet_names, name) -> BytesIO:
+    """Creating xlsx report with a sheet of every context, the template is rendered and saved once."""
+    payloads = [
+        dict(context, sheet_name=sheet_name) for context, sheet_name in zip(contexts, unique_sheet_names(sheet_names))
+    ]
+    xlsx_report = BytesIO()
+    with template.lock:
+        writer = template.book_writer()
+        try:
+            writer.render_book(payloads=payloads)
+            with stage("save"):
+                writer.save(xlsx_report)
+        except Exception:
+            template.reset_book_writer()
+            raise
+    xlsx_report.name = f"{name}.xlsx"
+    return xlsx_report
+
+
+def render_txt(template, context, jinja_env, name) -> BytesIO:
+    """Creating txt report from text of paragraphs and tables of docx template."""
+    txt_report = BytesIO()
+    for text in template.txt_template(jinja_env).generate(context):
+        txt_report.write(text.encode())
+    txt_report.name = f"{name}.txt"
+    return txt_report
+
+
+# Engine of each report type, libraries of an engine are imported by its first render.
+ENGINES = {
+    "docx": render_docx,
+    "xlsx": lambda template, context, jinja_env, name: render_xlsx(template, context, name),
+    "txt": render_txt,
+}
+
+
+def render(template, report_type, context, jinja_env, name) -> BytesIO:
+    """Returns report file of type docx, xlsx or txt rendered from template."""
+    return ENGINES.get(report_type, render_txt)(template, context, jinja_env, name)
+
+
+def build_payloads(template, contexts) -> list:
+    """
+    Returns pickled plain copies of contexts for rendering in worker processes
+    or None when template or context data can't be copied.
+    """
+    try:
+        tree = template.paths()
+        return [pickle.dumps(build_payload(context, tree), pickle.HIGHEST_PROTOCOL) for context in contexts]
+    except (jinja2.TemplateSyntaxError, SnapshotError, pickle.PicklingError, TypeError, AttributeError):
+        return None
+
+
+def _init_worker(data, report_type, name):
+    # Environment of parent process is rebuilt, jinja caches have locks of their own.
+    _worker.update(
+        template=Template(data),
+        report_type=report_type,
+        name=name,
+        jinja_env=create_jinja_env(_jinja_env.cache_dir if _jinja_env is not None else None),
+    )
+
+
+def _render_payload(payload) -> tuple:
+    report = render(_worker["template"], _worker["report_type"], pickle.loads(payload), _worker["jinja_env"],
+                    _worker["name"])
+    return report.name, report.getvalue()
+
+
+def parallel_available() -> bool:
+    """
+    Returns whether worker processes can be forked with the data of current process. Processes
+    with other threads, e.g. threaded server or cron threads, render sequentially: a lock held
+    by another thread at fork would never be released in the forked process.
+    """
+    return "fork" in multiprocessing.get_all_start_methods() and threading.active_count() == 1
+
+
+def render_parallel(template, report_type, payloads, name, workers) -> list:
+    """Returns report files rendered from payloads by a pool of processes, in order of payloads."""
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("fork"),
+        initializer=_init_worker,
+        initargs=(template.data, report_type, name),
+    ) as executor:
+        reports = []
+        chunksize = max(1, len(payloads) // (workers * 4))
+        for report_name, data in executor.map(_render_payload, payloads, chunksize=chunksize):
+            report = BytesIO(data)
+            report.name = report_name
+            reports.append(report)
+        return reports
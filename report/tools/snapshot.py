@@ -0,0 +1,205 @@
+"""
+Plain copies of the ORM data that templates read, used to render records in other processes.
+
+Attribute paths read by a template are collected from its jinja syntax tree, e.g.
+``{{ record.partner_id.name }}`` gives ``record -> partner_id -> name``, loop variables
+are resolved to the path of the iterated value. Only these paths are read from records.
+Paths which call a method or read an item of another object can't be copied, such templates
+are rendered in the current process.
+"""
+import sys
+from datetime import date, time, timedelta
+from decimal import Decimal
+from io import BytesIO
+
+from jinja2 import nodes
+
+from .images import IMAGE_FIELDS
+
+PLAIN_TYPES = (str, bytes, int, float, bool, type(None), date, time, timedelta, Decimal)
+X2MANY_TYPES = ("one2many", "many2many")
+
+
+class SnapshotError(Exception):
+    """Raised when a value read by template can't be copied."""
+
+
+class Snapshot:
+    """Read-only copy of attributes of a record or another object."""
+
+    def __init__(self, values, truthy=True, label=""):
+        self._values = values
+        self._truthy = truthy
+        self._label = label
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        try:
+            return self._values[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __getitem__(self, name):
+        return self._values[name]
+
+    def __bool__(self) -> bool:
+        return self._truthy
+
+    def __len__(self) -> int:
+        return int(self._truthy)
+
+    def __iter__(self):
+        return iter([self] if self._truthy else [])
+
+    def __repr__(self) -> str:
+        return self._label
+
+
+class _PathCollector:
+    """Collects attribute paths of variables from jinja syntax tree."""
+
+    def __init__(self, tree):
+        self.tree = tree
+        self.aliases = {}
+
+    def path(self, node):
+        if isinstance(node, nodes.Name):
+            return self.aliases.get(node.name, (node.name,))
+        if isinstance(node, nodes.Getattr):
+            parent = self.path(node.node)
+            return parent and parent + (node.attr,)
+        if isinstance(node, nodes.Getitem) and isinstance(node.arg, nodes.Const) and isinstance(node.arg.value, str):
+            parent = self.path(node.node)
+            return parent and parent + (node.arg.value,)
+        return None
+
+    def bind(self, target, value):
+        path = self.path(value)
+        if path and isinstance(target, nodes.Name):
+            self.aliases[target.name] = path
+
+    def add(self, path):
+        tree = self.tree
+        for name in path:
+            tree = tree.setdefault(name, {})
+
+    def visit(self, node):
+        if isinstance(node, nodes.For):
+            self.visit(node.iter)
+            self.bind(node.target, node.iter)
+            for child in node.body + node.else_ + ([node.test] if node.test else []):
+                self.visit(child)
+            return
+        if isinstance(node, nodes.Assign):
+            self.visit(node.node)
+            self.bind(node.target, node.node)
+            return
+        if isinstance(node, nodes.With):
+            for target, value in zip(node.targets, node.values):
+                self.visit(value)
+                self.bind(target, value)
+            for child in node.body:
+                self.visit(child)
+            return
+        if isinstance(node, nodes.Name) and node.ctx != "load":
+            return
+        if isinstance(node, nodes.Filter) and node.name == "replace_image":
+            # Records given to the filter are read as the image variant it picks.
+            path = self.path(node.node)
+            if path:
+                for name in IMAGE_FIELDS:
+                    self.add(path + (name,))
+        if isinstance(node, (nodes.Name, nodes.Getattr, nodes.Getitem)):
+            path = self.path(node)
+            if path:
+                self.add(path)
+        for child in node.iter_child_nodes():
+            self.visit(child)
+
+
+def template_paths(sources) -> dict:
+    """Returns tree of attributes read from each variable, sources are pairs of jinja environment and source."""
+    tree = {}
+    for environment, source in sources:
+        _PathCollector(tree).visit(environment.parse(source))
+    return tree
+
+
+def _is_recordset(value) -> bool:
+    return hasattr(value, "_name") and hasattr(value, "_ids") and hasattr(value, "_fields")
+
+
+def snapshot(value, tree, many=False):
+    """Returns plain copy of value with attributes of tree."""
+    if _is_recordset(value):
+        if many or len(value) > 1:
+            return [_snapshot_record(record, tree) for record in value]
+        return _snapshot_record(value, tree)
+    if isinstance(value, (list, tuple)):
+        return type(value)(snapshot(item, tree) for item in value)
+    if isinstance(value, dict):
+        return {key: snapshot(item, {}) for key, item in value.items()}
+    if _is_image(value):
+        return ImageCopy(value)
+    if isinstance(value, PLAIN_TYPES) or not tree:
+        return value
+    values = {}
+    for name, subtree in tree.items():
+        try:
+            attribute = getattr(value, name)
+        except Exception as e:
+            raise SnapshotError(f"{value!r} has no attribute {name}") from e
+        values[name] = snapshot(_copyable(value, name, attribute), subtree)
+    return Snapshot(values, bool(value), repr(value))
+
+
+def _copyable(value, name, attribute):
+    """Returns attribute unless it is a method, which only works on the original object."""
+    if callable(attribute) and not _is_recordset(attribute):
+        raise SnapshotError(f"{value!r}.{name} is a method")
+    return attribute
+
+
+def _is_image(value) -> bool:
+    """Returns whether value is PIL image, PIL isn't imported when no image was created."""
+    image_module = sys.modules.get("PIL.Image")
+    return image_module is not None and isinstance(value, image_module.Image)
+
+
+def _open_image(data):
+    from PIL import Image
+    return Image.open(BytesIO(data))
+
+
+class ImageCopy:
+    """Image which is opened again from png data when unpickled, pickled PIL images lose their file."""
+
+    def __init__(self, image):
+        fp = BytesIO()
+        image.save(fp, "png")
+        self.data = fp.getvalue()
+
+    def __reduce__(self):
+        return _open_image, (self.data,)
+
+
+def _snapshot_record(record, tree) -> Snapshot:
+    values = {}
+    for name, subtree in tree.items():
+        try:
+            value = getattr(record, name)
+        except AttributeError:
+            # Missing attribute is undefined for the template in any process.
+            continue
+        except Exception as e:
+            raise SnapshotError(f"{record!r}.{name} can't be read: {e}") from e
+        field = record._fields.get(name)
+        values[name] = snapshot(_copyable(record, name, value), subtree,
+                                many=field is not None and field.type in X2MANY_TYPES)
+    return Snapshot(values, bool(record), f"{record._name}{tuple(record.ids)}")
+
+
+def build_payload(context, tree) -> dict:
+    """Returns plain copy of variables of context read by template."""
+    return {name: snapshot(context[name], subtree) for name, subtree in tree.items() if name in context}
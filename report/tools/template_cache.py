@@ -0,0 +1,146 @@
+"""
+Per worker cache of decoded report templates.
+
+Entries are keyed by report id and template checksum, so a new version of a template
+never hits a stale entry, and hold the template bytes, its type and a parsed skeleton
+that is reused by every render of the template. Libraries of docx and xlsx templates
+are imported when a template of the type is used for the first time.
+"""
+import re
+import threading
+from io import BytesIO
+from zipfile import ZipFile, BadZipFile
+
+import jinja2
+
+from .lru import LRUCache
+from .snapshot import template_paths
+
+# Parsed workbooks take a lot more memory than their zipped source.
+WORKBOOK_SIZE_FACTOR = 10
+PICTURE_EXTENT_RE = re.compile(rb'<a:ext cx="(\d+)" cy="(\d+)"')
+PICTURE_PARTS = ("word/document", "word/header", "word/footer", "xl/drawings/drawing")
+EMU_PER_PIXEL = 9525
+
+templates = LRUCache(max_entries=64, max_size=64 * 1024 * 1024)
+
+
+def detect_type(data) -> str:
+    """Returns docx or xlsx by the content of OOXML package."""
+    try:
+        with ZipFile(BytesIO(data)) as package:
+            names = set(package.namelist())
+    except BadZipFile:
+        return ""
+    if "word/document.xml" in names:
+        return "docx"
+    if "xl/workbook.xml" in names:
+        return "xlsx"
+    return ""
+
+
+def picture_size(data) -> int:
+    """Returns larger side in pixels of the biggest picture placed in OOXML package."""
+    size = 0
+    try:
+        with ZipFile(BytesIO(data)) as package:
+            for name in package.namelist():
+                if name.startswith(PICTURE_PARTS) and name.endswith(".xml"):
+                    for cx, cy in PICTURE_EXTENT_RE.findall(package.read(name)):
+                        size = max(size, int(cx) // EMU_PER_PIXEL, int(cy) // EMU_PER_PIXEL)
+    except BadZipFile:
+        pass
+    return size
+
+
+class Template:
+    """Decoded template with its type and skeleton parsed once for all renders."""
+
+    def __init__(self, data):
+        self.data = data
+        self.type = detect_type(data)
+        self.lock = threading.Lock()
+        self.patched_xml = {}
+        self._book_writer = None
+        self._paths = None
+        self._txt_source = None
+        self._txt_template = None
+        self._image_size = None
+
+    @property
+    def size(self) -> int:
+        if self.type == "xlsx":
+            return len(self.data) * WORKBOOK_SIZE_FACTOR
+        return len(self.data) * 2
+
+    def docx_template(self):
+        """Returns new docx template which reuses xml already prepared for jinja."""
+        from .docx_template import CachedDocxTemplate
+        return CachedDocxTemplate(self)
+
+    def book_writer(self):
+        """Returns workbook writer of template, must be used under lock."""
+        if self._book_writer is None:
+            from xltpl.writerx import BookWriter
+            self._book_writer = BookWriter(BytesIO(self.data))
+        return self._book_writer
+
+    def jinja_sources(self) -> list:
+        """Returns pairs of jinja environment and source of every templated part."""
+        if self.type == "xlsx":
+            with self.lock:
+                writer = self.book_writer()
+                return [
+                    (writer.jinja_env, sheet_state.get_sheet_resource().tpl)
+                    for sheet_state in writer.sheet_resource_map.sheet_state_list
+                ]
+        writer = self.docx_template()
+        writer.init_docx()
+        jinja_env = jinja2.Environment()
+        sources = [(jinja_env, writer.patch_xml(writer.get_xml()))]
+        for uri in (writer.HEADER_URI, writer.FOOTER_URI):
+            for _rel_key, part in writer.get_headers_footers(uri):
+                sources.append((jinja_env, writer.patch_xml(writer.get_part_xml(part))))
+        return sources
+
+    def paths(self) -> dict:
+        """Returns tree of attributes read by template from each variable."""
+        if self._paths is None:
+            self._paths = template_paths(self.jinja_sources())
+        return self._paths
+
+    def txt_template(self, jinja_env) -> jinja2.Template:
+        """Returns jinja template of text of docx paragraphs and tables, compiled once for environment."""
+        if self._txt_source is None:
+            from .docx_template import txt_source
+            self._txt_source = txt_source(self.data)
+        compiled = self._txt_template
+        if compiled is None or compiled.environment is not jinja_env:
+            # Jinja drops the last newline of source unless the environment keeps it.
+            source = self._txt_source if jinja_env.keep_trailing_newline else self._txt_source + "\n"
+            compiled = self._txt_template = jinja_env.from_string(source)
+        return compiled
+
+    def image_size(self) -> int:
+        """Returns size in pixels of pictures of template, images put in their place needn't be larger."""
+        if self._image_size is None:
+            self._image_size = picture_size(self.data)
+        return self._image_size
+
+    def reset_book_writer(self):
+        """Removes sheets left by a failed render from workbook writer."""
+        if self._book_writer is not None:
+            for sheet in self._book_writer.workbook.worksheets:
+                self._book_writer.workbook.remove(sheet)
+            self._book_writer.sheet_writer_map.clear()
+
+
+def get_template(report_id, checksum, load) -> Template:
+    """Returns cached template of report, load returns template bytes on a miss."""
+    return templates.get_or_create((report_id, checksum), lambda: Template(load()), lambda template: template.size)
+
+
+def invalidate(report_ids):
+    """Removes templates of reports from cache."""
+    report_ids = set(report_ids)
+    templates.discard(lambda key: key[0] in report_ids)
@@ -0,0 +1,71 @@
+"""
+Wall time of the stages of report generation.
+
+Stages are measured exclusively: time of a stage started inside another one, e.g. a record
+rendered while the zip archive takes it, isn't counted twice. Stages are no-ops outside
+of measure(), so the rendering functions can be used without measuring.
+"""
+import time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+
+STAGES = ["contexts", "template", "render", "save", "convert", "merge", "attachment"]
+
+_current = ContextVar("report_timings", default=None)
+
+
+class Timings:
+    """Durations of stages in seconds."""
+
+    def __init__(self):
+        self.durations = dict.fromkeys(STAGES, 0.0)
+        self.total = 0.0
+        self._stack = []
+
+    def _add(self, frame, now):
+        self.durations[frame[0]] = self.durations.get(frame[0], 0.0) + now - frame[1]
+
+    @contextmanager
+    def stage(self, name):
+        now = time.perf_counter()
+        if self._stack:
+            self._add(self._stack[-1], now)
+        self._stack.append([name, now])
+        try:
+            yield
+        finally:
+            now = time.perf_counter()
+            self._add(self._stack.pop(), now)
+            if self._stack:
+                self._stack[-1][1] = now
+
+
+@contextmanager
+def measure():
+    """Measures stages of code in the block, yields their timings."""
+    timings = Timings()
+    token = _current.set(timings)
+    started = time.perf_counter()
+    try:
+        yield timings
+    finally:
+        timings.total = time.perf_counter() - started
+        _current.reset(token)
+
+
+def stage(name):
+    """Returns context manager measuring stage of current measurement."""
+    timings = _current.get()
+    return timings.stage(name) if timings is not None else nullcontext()
+
+
+def iterate(name, iterable):
+    """Yields items of iterable measuring the time taken by each item as stage."""
+    iterator = iter(iterable)
+    while True:
+        with stage(name):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item